@@ -1,8 +1,16 @@
-from fastapi import FastAPI, HTTPException, Path
+from fastapi import FastAPI, HTTPException, Path, Request, UploadFile, File
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, Any,Optional
-from utils.utils import get_property_info,generate_report
+from utils.utils import get_property_info,generate_report,check_missing_values
+from utils.jobs import JobQueue
+from utils.batch import BATCH_CONCURRENCY, BATCH_CONCURRENCY_MAX, read_batch, run_batch
+from utils.cache import cache_stats
+from utils import metrics
+import asyncio
+import time
+import uuid
 import os
 import json
 from urllib.parse import unquote
@@ -16,6 +24,33 @@ app.add_middleware(
 )
 BASE_URL = "http://127.0.0.1:8000"
 REPORTS_DIR = "reports"
+# how often (seconds) an event stream checks its job for new events, and sends a keep-alive when idle
+JOB_EVENTS_POLL = float(os.getenv("JOB_EVENTS_POLL", "0.25"))
+JOB_EVENTS_KEEPALIVE = float(os.getenv("JOB_EVENTS_KEEPALIVE", "15"))
+# batches run one after another, each with its own pool of BATCH_CONCURRENCY report workers
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "1"))
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template so /download/<name> doesn't create a series per report
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        metrics.http_request_duration.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint, status=status)
+
+# reports are generated on background workers so the event loop stays free
+# with stream=True the PDF is rendered in memory and its bytes become the job result
+report_jobs = JobQueue(lambda report_type, data, stream=False, **options: generate_report(report_type, data, None if stream else REPORTS_DIR, **options))
+batch_jobs = JobQueue(
+    lambda report_type, data, batch_id, trace=None, **options: run_batch(data["items"], os.path.join(REPORTS_DIR, "batches", batch_id), batch_id=batch_id, **options),
+    workers=BATCH_WORKERS,
+)
 
 # Define the input data model
 class ReportRequest(BaseModel):
@@ -25,22 +60,55 @@ class ReportRequest(BaseModel):
 class DataRequest(BaseModel):
     property_address: str
 
-def check_missing_values(property_info):
-    required_keys = [
-        'address', 'days_on_market', 'main_img_url', 'url', 'zestimate',
-        'Assessed_value', 'square_footage', 'totalBathrooms', 'totalBedrooms',
-        'Porperty_size', 'specifications', 'longitude', 'latitude'
-    ]
-    
-    missing_keys = [key for key in required_keys if key not in property_info or property_info[key] in [None, "N/A", "", 0]]
-
-    if missing_keys:
-        return {"missing_keys": missing_keys, "status": "Some required values are missing"}
-    return True
-
 def fix_space_link(url):
     return url.replace("%20", "+").replace(" ", "+").replace("\"","").replace(",","%2C") 
 
+def report_response(report_path):
+    # Create a download link
+    report_name = os.path.basename(report_path)
+    download_link = f"{BASE_URL}/download/{report_name}"
+    return {"message": "Report generated successfully.", "download_link": download_link}
+
+def find_job(job_id):
+    job = report_jobs.get(job_id) or batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+def job_response(job):
+    response = job.to_dict()
+    response["status_url"] = f"{BASE_URL}/jobs/{job.id}"
+    if job.status == "done" and isinstance(job.result, str):
+        response.update(report_response(job.result))
+    return response
+
+def pdf_response(report_type, data, pdf_bytes, job):
+    from utils.rep_gen import format_address
+    report_name = f"{report_type}_report{format_address(data['address'])}.pdf"
+    # stage timings as a Server-Timing header, durations in milliseconds
+    stages = job.trace.summary()["stages"]
+    server_timing = ", ".join(f"{name};dur={stage['seconds'] * 1000:.0f}" for name, stage in stages.items())
+    headers = {"Content-Disposition": f'attachment; filename="{report_name}"', "Server-Timing": server_timing, "X-Job-Id": job.id}
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+async def run_report_job(report_type, data, wait, use_cache=True, stream=False):
+    if stream:
+        # the PDF goes straight back in this response, nothing is written to REPORTS_DIR
+        job = report_jobs.submit(report_type, data, use_cache=use_cache, stream=True)
+        try:
+            pdf_bytes = await asyncio.wrap_future(job.future)
+        finally:
+            # finished jobs are kept for polling, the PDF itself isn't
+            job.release_result()
+        return pdf_response(report_type, data, pdf_bytes, job)
+    job = report_jobs.submit(report_type, data, use_cache=use_cache)
+    if not wait:
+        return job_response(job)
+    report_path = await asyncio.wrap_future(job.future)
+    response = report_response(report_path)
+    response["timings"] = job.trace.summary()
+    return response
+
 
 @app.get("/generate-report-new/")
 async def generate_report_endpoint(
@@ -57,7 +125,10 @@ async def generate_report_endpoint(
     property_size: int,
     specifications: str,
     longitude: float,
-    latitude: float
+    latitude: float,
+    wait: bool = True,
+    use_cache: bool = True,
+    stream: bool = False
 ):
     if report_type not in ["buyer", "seller"]:
         raise HTTPException(status_code=400, detail="Invalid report type. Use 'buyer' or 'seller'.")
@@ -86,17 +157,11 @@ async def generate_report_endpoint(
     if check_return != True:
         return check_return
 
-    # Generate the report
-    report_path = generate_report(report_type, data, REPORTS_DIR)
-
-    # Create a download link
-    report_name = os.path.basename(report_path)
-    download_link = f"{BASE_URL}/download/{report_name}"
-
-    return {"message": "Report generated successfully.", "download_link": download_link}
+    # Generate the report on a worker, with wait=false only the job id is returned, with stream=true the PDF itself
+    return await run_report_job(report_type, data, wait, use_cache, stream)
 
 @app.post("/generate-report/")
-async def generate_report_endpoint(request: ReportRequest):
+async def generate_report_endpoint(request: ReportRequest, wait: bool = True, use_cache: bool = True, stream: bool = False):
     if request.report_type not in ["buyer", "seller"]:
         raise HTTPException(status_code=400, detail="Invalid report type. Use 'buyer' or 'seller'.")
 
@@ -104,19 +169,109 @@ async def generate_report_endpoint(request: ReportRequest):
     check_return = check_missing_values(request.data)
     if check_return != True:
         return check_return
-    # Generate the report
-    report_path = generate_report(request.report_type, request.data, REPORTS_DIR)
+    # Generate the report on a worker, with wait=false only the job id is returned, with stream=true the PDF itself
+    return await run_report_job(request.report_type, request.data, wait, use_cache, stream)
 
-    # Create a download link
-    report_name = os.path.basename(report_path)
-    download_link = f"{BASE_URL}/download/{report_name}"
+@app.get("/jobs/{job_id}")
+async def get_report_job(job_id: str):
+    return job_response(find_job(job_id))
+
+async def job_event_stream(job, index=0):
+    idle = 0.0
+    while True:
+        events = job.events[index:]
+        for event in events:
+            data = dict(event)
+            if event["event"] in ("done", "failed"):
+                # the last event carries the job status with the download link and timings
+                data.update(job_response(job))
+            yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(data)}\n\n"
+            if event["event"] in ("done", "failed"):
+                return
+        index += len(events)
+        idle = 0.0 if events else idle + JOB_EVENTS_POLL
+        if idle >= JOB_EVENTS_KEEPALIVE:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(JOB_EVENTS_POLL)
+
+@app.get("/jobs/{job_id}/events")
+async def get_report_job_events(job_id: str, request: Request):
+    job = find_job(job_id)
+    # a reconnecting EventSource resumes after the last event it received
+    last_event_id = request.headers.get("last-event-id", "")
+    start = int(last_event_id) + 1 if last_event_id.isdigit() else 0
+    return StreamingResponse(
+        job_event_stream(job, start),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def batch_response(job):
+    response = job_response(job)
+    response["batch_id"] = job.id
+    response["batch_url"] = f"{BASE_URL}/batch/{job.id}"
+    response["items"] = len(job.data["items"])
+    manifest = job.result
+    if manifest is not None:
+        for item in manifest["items"]:
+            if item.get("report"):
+                item["download_link"] = f"{BASE_URL}/download/batches/{job.id}/{item['report']}"
+        if manifest.get("zip"):
+            manifest["zip_link"] = f"{BASE_URL}/download/batches/{os.path.basename(manifest['zip'])}"
+        response["manifest"] = manifest
+    return response
+
+@app.post("/batch")
+async def generate_batch(
+    file: UploadFile = File(...),
+    report_type: str = "buyer",
+    concurrency: int = BATCH_CONCURRENCY,
+    zip: bool = False,
+    use_cache: bool = True
+):
+    if report_type not in ["buyer", "seller"]:
+        raise HTTPException(status_code=400, detail="Invalid report type. Use 'buyer' or 'seller'.")
+    try:
+        items = read_batch((await file.read()).decode("utf-8-sig"), report_type, file.filename or "")
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the address list: {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="No addresses found. Upload a CSV with an 'address' column or JSONL objects with an 'address' key.")
+    batch_id = uuid.uuid4().hex
+    # each finished item is reported as an "item_done" event on /jobs/{batch_id}/events
+    job = batch_jobs.submit("batch", {"items": items}, job_id=batch_id, batch_id=batch_id,
+                            concurrency=min(max(1, concurrency), BATCH_CONCURRENCY_MAX), use_cache=use_cache, make_zip=zip)
+    return batch_response(job)
+
+@app.get("/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    job = batch_jobs.get(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+    return batch_response(job)
+
+@app.get("/jobs")
+async def get_report_jobs_stats():
+    return report_jobs.stats()
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return await asyncio.to_thread(cache_stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    stats = await asyncio.to_thread(cache_stats)
+    for name, cache in stats.items():
+        metrics.cache_hit_ratio.set(cache["hit_ratio"], cache=name)
+        metrics.cache_entries.set(cache["entries"], cache=name)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-    return {"message": "Report generated successfully.", "download_link": download_link}
 @app.get("/get_property_info")
 async def get_address(property_address:str):
     print(property_address)
     try:
-        data = get_property_info(property_address)
+        data = await asyncio.to_thread(get_property_info, property_address)
         #print main image url 
         if data and 'main_img_url' in data:
             print("Main Image URL:", data['main_img_url'])
@@ -140,4 +295,5 @@ async def download_report(report_name: str = Path(..., regex=".*", description="
     if not os.path.exists(report_path):
         raise HTTPException(status_code=404, detail="Report not found.")
     
-    return FileResponse(path=report_path, filename=decoded_report_name, media_type="application/pdf")
+    media_type = "application/zip" if report_path.endswith(".zip") else "application/pdf"
+    return FileResponse(path=report_path, filename=os.path.basename(decoded_report_name), media_type=media_type)
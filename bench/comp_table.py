@@ -0,0 +1,80 @@
+"""
+Comparable filtering benchmark: the one-listing-at-a-time path (read_comps plus Python
+filters) against the columnar CompTable, on a large synthetic search built from
+bench/fixtures/search_sold.json spread around the subject.
+
+    python -m bench.comp_table --listings 5000 --runs 5
+"""
+import argparse
+import copy
+import json
+import random
+import statistics
+import time
+
+from bench.stub_server import load_fixture
+from utils.comps import CompTable, read_comps
+
+
+def make_results(count, spread=0.05, seed=0):
+    """
+    Returns:
+    - tuple: (searchResults with count listings scattered spread degrees around the fixture subject, subject latitude, subject longitude).
+    """
+    subject = load_fixture("byaddress.json")["propertyDetails"]
+    listings = load_fixture("search_sold.json")["searchResults"]
+    rnd = random.Random(seed)
+    results = []
+    for i in range(count):
+        item = copy.deepcopy(listings[i % len(listings)])
+        location = item["property"]["location"]
+        location["latitude"] = subject["latitude"] + rnd.uniform(-spread, spread)
+        location["longitude"] = subject["longitude"] + rnd.uniform(-spread, spread)
+        results.append(item)
+    return results, subject["latitude"], subject["longitude"]
+
+
+def scalar(results, latitude, longitude, radius, max_beds, min_baths, n):
+    comps = read_comps({"searchResults": results}, latitude, longitude)
+    kept = [(comp.distance, i) for i, comp in enumerate(comps)
+            if comp.distance is not None and comp.distance <= radius
+            and comp.bedrooms is not None and comp.bedrooms <= max_beds
+            and comp.bathrooms is not None and comp.bathrooms >= min_baths]
+    return [i for _, i in sorted(kept)[:n]]
+
+
+def vectorized(results, latitude, longitude, radius, max_beds, min_baths, n):
+    table = CompTable(results, latitude, longitude)
+    return list(table.top(n, table.mask(radius=radius, max_beds=max_beds, min_baths=min_baths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--radius", type=float, default=1.0)
+    parser.add_argument("--max-beds", type=int, default=4)
+    parser.add_argument("--min-baths", type=int, default=2)
+    parser.add_argument("--top", type=int, default=6)
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    results, latitude, longitude = make_results(args.listings)
+    summary = {"listings": args.listings}
+    picked = {}
+    for name, run in (("scalar", scalar), ("vectorized", vectorized)):
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            picked[name] = run(results, latitude, longitude, args.radius, args.max_beds, args.min_baths, args.top)
+            timings.append(time.perf_counter() - start)
+        summary[f"{name}_ms"] = round(statistics.median(timings) * 1000, 2)
+    summary["same_top"] = picked["scalar"] == [int(i) for i in picked["vectorized"]]
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"{args.listings} listings, top {args.top}: scalar {summary['scalar_ms']} ms, vectorized {summary['vectorized_ms']} ms, same top: {summary['same_top']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Offline load benchmark for report generation.
+
+Starts the local Zillow/OpenAI stub (bench/stub_server.py) unless --stub-url is given, points
+the app at it, then generates reports at the chosen concurrency, either by calling
+generate_report directly (--mode pipeline) or through POST /generate-report/ on a local
+uvicorn server (--mode api). Reports p50/p95/p99 latency, throughput, peak RSS, upstream
+calls and the mean time spent in each stage.
+
+    python -m bench.report_load --mode pipeline --reports 40 --concurrency 4 --openai-latency-ms 800
+    python -m bench.report_load --mode api --reports 40 --concurrency 8 --error-rate 0.05 --json
+    python -m bench.report_load --comp-search-mode planned --spread 3
+
+Every report uses its own subject property unless --subjects is lower than --reports, so
+runs measure cold caches by default. Caches live in a temp folder unless --cache-dir is given.
+"""
+import argparse
+import copy
+import json
+import math
+import os
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.stub_server import add_stub_arguments, load_fixture, start_stub, stub_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def make_subjects(base_url, count, spacing=0.02):
+    """
+    Returns:
+    - list: count variations of the fixture subject, each with its own address, listing URL and
+      location spacing degrees of latitude apart, so none of them share tax or OpenAI answers.
+      The default spacing also puts each in its own comp tile; below COMP_TILE_SIZE neighbours share tiles.
+    """
+    subject = json.loads(json.dumps(load_fixture("subject.json")).replace("{base_url}", base_url))
+    subjects = []
+    for i in range(count):
+        data = copy.deepcopy(subject)
+        street, rest = data["address"].split(" ", 1)
+        data["address"] = f"{street}{'' if i == 0 else f'-{i}'} {rest}"
+        data["url"] = data["url"].replace("_zpid", f"{i}_zpid")
+        data["latitude"] = round(data["latitude"] + spacing * i, 6)
+        subjects.append(data)
+    return subjects
+
+
+def get_json(url):
+    import requests
+    return requests.get(url, timeout=10).json()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_pipeline(jobs, concurrency, out_dir, use_cache):
+    from utils.tracing import Trace
+    from utils.utils import generate_report
+
+    def one(job):
+        report_type, data = job
+        trace = Trace()
+        start = time.perf_counter()
+        try:
+            path = generate_report(report_type, copy.deepcopy(data), out_dir, use_cache=use_cache, trace=trace)
+            ok = os.path.exists(path)
+        except Exception as e:
+            print("BENCH_REPORT_FAILED", e)
+            ok = False
+        return time.perf_counter() - start, ok, trace.summary()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, jobs))
+
+
+def run_api(jobs, concurrency, out_dir, use_cache):
+    import requests
+    import uvicorn
+    import app
+
+    # reports land in the bench folder rather than reports/
+    app.REPORTS_DIR = out_dir
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-api", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    url = f"http://127.0.0.1:{port}/generate-report/"
+    local = threading.local()
+
+    def one(job):
+        report_type, data = job
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.post(url, params={"use_cache": str(use_cache).lower()}, json={"report_type": report_type, "data": data}, timeout=600)
+            body = response.json()
+            ok = response.status_code == 200 and "download_link" in body
+        except Exception as e:
+            print("BENCH_REQUEST_FAILED", e)
+            ok, body = False, {}
+        return time.perf_counter() - start, ok, body.get("timings")
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(one, jobs))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def stage_means(timings):
+    totals = {}
+    for timing in timings:
+        for name, stage in (timing or {}).get("stages", {}).items():
+            totals.setdefault(name, []).append(stage["seconds"])
+    return {name: round(statistics.mean(seconds), 3) for name, seconds in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["pipeline", "api"], default="pipeline")
+    parser.add_argument("--reports", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--report-type", choices=["buyer", "seller", "mixed"], default="mixed")
+    parser.add_argument("--subjects", type=int, default=None, help="distinct properties cycled through, defaults to --reports")
+    parser.add_argument("--subject-spacing", type=float, default=0.02, help="degrees of latitude between subjects, below 0.01 neighbours share a comp tile")
+    parser.add_argument("--warmup", type=int, default=0, help="reports generated before measuring")
+    parser.add_argument("--no-llm-cache", action="store_true", help="pass use_cache=False so every report asks the OpenAI stub")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--comp-search-mode", choices=["concurrent", "serial", "planned"], default=None, help="COMP_SEARCH_MODE for the run, the environment's by default")
+    parser.add_argument("--stub-url", default=None, help="use an already running stub server instead of starting one")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stub = None
+    base_url = args.stub_url
+    if base_url is None:
+        stub = start_stub(stub_config(args))
+        base_url = stub.base_url
+    work_dir = tempfile.mkdtemp(prefix="report-bench-")
+    out_dir = os.path.join(work_dir, "reports")
+    os.makedirs(out_dir)
+    # the app reads its settings when imported, so they are set before the first import
+    os.environ["ZILLOW_API_URL"] = base_url
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+    os.environ["ZILLOW_KEY"] = "bench"
+    os.environ["OPENAPI_KEY"] = "bench"
+    os.environ["CACHE_DIR"] = args.cache_dir or os.path.join(work_dir, "cache")
+    if args.comp_search_mode:
+        os.environ["COMP_SEARCH_MODE"] = args.comp_search_mode
+    # logo and fallback image paths are relative to the repository root
+    os.chdir(ROOT)
+
+    types = ["buyer", "seller"] if args.report_type == "mixed" else [args.report_type]
+    subjects = make_subjects(base_url, args.subjects or args.warmup + args.reports, args.subject_spacing)
+    jobs = [(types[i % len(types)], subjects[i % len(subjects)]) for i in range(args.warmup + args.reports)]
+    run = run_pipeline if args.mode == "pipeline" else run_api
+
+    if args.warmup:
+        run(jobs[:args.warmup], args.concurrency, out_dir, not args.no_llm_cache)
+    calls_before = get_json(base_url + "/__stats")
+    start = time.perf_counter()
+    results = run(jobs[args.warmup:], args.concurrency, out_dir, not args.no_llm_cache)
+    elapsed = time.perf_counter() - start
+    calls_after = get_json(base_url + "/__stats")
+    if stub is not None:
+        stub.shutdown()
+
+    latencies = [latency for latency, ok, _ in results if ok]
+    upstream_calls = {name: count - calls_before["calls"].get(name, 0) for name, count in calls_after["calls"].items()}
+    summary = {
+        "mode": args.mode,
+        "comp_search_mode": os.getenv("COMP_SEARCH_MODE", "concurrent"),
+        "reports": args.reports,
+        "concurrency": args.concurrency,
+        "report_type": args.report_type,
+        "ok": len(latencies),
+        "failed": len(results) - len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "p50": round(percentile(latencies, 50), 3) if latencies else None,
+        "p95": round(percentile(latencies, 95), 3) if latencies else None,
+        "p99": round(percentile(latencies, 99), 3) if latencies else None,
+        # includes the in-process stub server unless --stub-url is used
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "upstream_calls": upstream_calls,
+        "comp_searches_per_report": round(upstream_calls.get("bycoordinates", 0) / len(results), 2) if results else None,
+        "upstream_errors": {name: count - calls_before["errors"].get(name, 0) for name, count in calls_after["errors"].items()},
+        "stage_means": stage_means(timing for _, _, timing in results),
+    }
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"{summary['mode']}: {summary['ok']}/{args.reports} {args.report_type} reports ok at concurrency {args.concurrency} in {summary['seconds']} s")
+        print(f"latency p50 {summary['p50']} s, p95 {summary['p95']} s, p99 {summary['p99']} s, throughput {summary['throughput']} reports/s, peak RSS {summary['peak_rss_mb']} MB")
+        print("upstream calls: " + ", ".join(f"{name} {count}" for name, count in sorted(summary["upstream_calls"].items()))
+              + f" ({summary['comp_searches_per_report']} comp searches per report, COMP_SEARCH_MODE {summary['comp_search_mode']})")
+        if summary["upstream_errors"]:
+            print("upstream errors: " + ", ".join(f"{name} {count}" for name, count in sorted(summary["upstream_errors"].items())))
+        print("stage means (s): " + ", ".join(f"{name} {seconds}" for name, seconds in summary["stage_means"].items()))
+    sys.exit(0 if summary["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Local stand-in for the Zillow (RapidAPI) and OpenAI endpoints used by the report pipeline,
+serving the payloads in bench/fixtures with configurable latency and error injection.
+
+    python -m bench.stub_server --port 8900 --zillow-latency-ms 300 --openai-latency-ms 1500 --error-rate 0.05
+
+Point the app at it with ZILLOW_API_URL=http://127.0.0.1:8900 and
+OPENAI_BASE_URL=http://127.0.0.1:8900/v1. GET /__stats returns the calls served per endpoint.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import cos, radians, sqrt
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# searches with a bathrooms filter only return listings with at least that many
+BATHROOM_FILTERS = {"OnePlus": 1, "TwoPlus": 2, "ThreePlus": 3, "FourPlus": 4}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StubConfig:
+    """
+    Args:
+    - zillow_latency (float): Seconds added to every Zillow response.
+    - openai_latency (float): Seconds added to every chat completion.
+    - image_latency (float): Seconds added to every photo download.
+    - jitter (float): Random extra latency, as a fraction of the base latency.
+    - error_rate (float): Share of requests answered with error_status instead.
+    - error_status (int): Status code of the injected errors.
+    - spread (float): Scales the listings' distance from the search centre, above 1 for sparser areas.
+    - page_size (int): Most listings a search returns per page, 0 for all of them. totalMatchingCount
+      still reports every match, so a capped search looks cut short like a full Zillow page.
+    """
+
+    def __init__(self, zillow_latency=0.0, openai_latency=0.0, image_latency=0.0, jitter=0.2, error_rate=0.0, error_status=503, seed=None, spread=1.0, page_size=0):
+        self.zillow_latency = zillow_latency
+        self.openai_latency = openai_latency
+        self.image_latency = image_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.spread = spread
+        self.page_size = page_size
+        self.random = random.Random(seed)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, StubHandler)
+        self.config = config
+        self.base_url = f"http://{self.server_address[0]}:{self.server_address[1]}"
+        self.fixtures = {
+            "byaddress": load_fixture("byaddress.json"),
+            "taxinfo": load_fixture("taxinfo.json"),
+            "Sold": load_fixture("search_sold.json"),
+            "For_Sale": load_fixture("search_for_sale.json"),
+            "chat": load_fixture("chat_completions.json"),
+        }
+        # fixture listings are laid out around the subject and moved to wherever a search is centred
+        subject = self.fixtures["byaddress"]["propertyDetails"]
+        self.center = (subject["latitude"], subject["longitude"])
+        self.images = {}
+        images_dir = os.path.join(FIXTURES_DIR, "images")
+        for name in os.listdir(images_dir):
+            with open(os.path.join(images_dir, name), "rb") as f:
+                self.images[name] = f.read()
+        self.calls = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def count(self, endpoint, error=False):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            if error:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors)}
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip("/")
+        if path == "/__stats":
+            return self.send_json(self.server.stats())
+        if path == "/pro/byaddress":
+            return self.respond("byaddress", self.server.config.zillow_latency, lambda: self.fixture("byaddress"))
+        if path == "/taxinfo":
+            return self.respond("taxinfo", self.server.config.zillow_latency, lambda: self.fixture("taxinfo"))
+        if path == "/search/bycoordinates":
+            return self.respond("bycoordinates", self.server.config.zillow_latency, lambda: self.search(query))
+        if path.startswith("/images/"):
+            name = path[len("/images/"):]
+            if name not in self.server.images:
+                return self.send_json({"message": "not found"}, 404)
+            return self.respond("images", self.server.config.image_latency, lambda: self.server.images[name], "image/jpeg")
+        self.send_json({"message": "not found"}, 404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if urlsplit(self.path).path.rstrip("/") in ("/v1/chat/completions", "/chat/completions"):
+            return self.respond("chat_completions", self.server.config.openai_latency, lambda: self.chat(json.loads(body or b"{}")))
+        self.send_json({"message": "not found"}, 404)
+
+    def respond(self, endpoint, latency, build, content_type="application/json"):
+        config = self.server.config
+        time.sleep(latency * (1 + config.jitter * config.random.random()))
+        if config.error_rate and config.random.random() < config.error_rate:
+            self.server.count(endpoint, error=True)
+            return self.send_json({"message": "injected error"}, config.error_status)
+        self.server.count(endpoint)
+        payload = build()
+        if content_type == "application/json":
+            return self.send_json(payload)
+        self.send_body(payload, content_type)
+
+    def fixture(self, name):
+        # photo links in the fixtures point at this server
+        raw = json.dumps(self.server.fixtures[name]).replace("{base_url}", self.server.base_url)
+        return json.loads(raw)
+
+    def search(self, query):
+        data = self.fixture(query.get("listingStatus", "For_Sale"))
+        latitude = float(query.get("latitude", self.server.center[0]))
+        longitude = float(query.get("longitude", self.server.center[1]))
+        d_lat = latitude - self.server.center[0]
+        d_lon = longitude - self.server.center[1]
+        radius = float(query.get("radius") or 1)
+        spread = self.server.config.spread
+        max_beds = int(query["bed_max"]) if query.get("bed_max", "").isdigit() else None
+        min_baths = BATHROOM_FILTERS.get(query.get("bathrooms"))
+        area_offset = (round(d_lat * 10000) * 100003 + round(d_lon * 10000)) * 1000
+        results = []
+        for item in data["searchResults"]:
+            prop = item["property"]
+            if max_beds is not None and prop["bedrooms"] > max_beds:
+                continue
+            if min_baths is not None and prop["bathrooms"] < min_baths:
+                continue
+            location = prop["location"]
+            location["latitude"] = latitude + (location["latitude"] - self.server.center[0]) * spread
+            location["longitude"] = longitude + (location["longitude"] - self.server.center[1]) * spread
+            # flat-earth distance is close enough within a few miles
+            miles = 69.0 * sqrt((location["latitude"] - latitude) ** 2 + ((location["longitude"] - longitude) * cos(radians(latitude))) ** 2)
+            if miles > radius:
+                continue
+            # listings moved to another area are other houses, so they get their own zpid
+            prop["zpid"] += area_offset
+            results.append(item)
+        data["resultsCount"] = {"totalMatchingCount": len(results)}
+        page_size = self.server.config.page_size
+        if page_size:
+            page = max(1, int(query["page"])) if query.get("page", "").isdigit() else 1
+            results = results[(page - 1) * page_size:page * page_size]
+        data["searchResults"] = results
+        return data
+
+    def chat(self, request):
+        answers = self.server.fixtures["chat"]
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        if "lowprice" in prompt:
+            content = answers["pricing"]
+        elif request.get("model", "").startswith("o"):
+            content = answers["recommendation"]
+        else:
+            content = answers["considerations"]
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4},
+        }
+
+    def send_json(self, payload, status=200):
+        self.send_body(json.dumps(payload).encode("utf-8"), "application/json", status)
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub(config=None, host="127.0.0.1", port=0):
+    """
+    Start the stub server on a background thread.
+
+    Returns:
+    - StubServer: The running server, its URL is server.base_url. Call server.shutdown() to stop it.
+    """
+    server = StubServer((host, port), config or StubConfig())
+    threading.Thread(target=server.serve_forever, name="bench-stub", daemon=True).start()
+    return server
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--zillow-latency-ms", type=float, default=0)
+    parser.add_argument("--openai-latency-ms", type=float, default=0)
+    parser.add_argument("--image-latency-ms", type=float, default=0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="random extra latency, as a fraction of the base latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--spread", type=float, default=1.0, help="scale the listings' distance from the search centre, e.g. 3 for a sparse area")
+    parser.add_argument("--page-size", type=int, default=0, help="most listings per search page, 0 for all; capped searches report the full totalMatchingCount")
+
+
+def stub_config(args):
+    return StubConfig(
+        zillow_latency=args.zillow_latency_ms / 1000,
+        openai_latency=args.openai_latency_ms / 1000,
+        image_latency=args.image_latency_ms / 1000,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+        spread=args.spread,
+        page_size=args.page_size,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    server = StubServer((args.host, args.port), stub_config(args))
+    print(f"stub serving {FIXTURES_DIR} on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Bulk report generation for lists of addresses.
+
+    python -m utils.batch addresses.csv --report-type buyer --concurrency 4 --zip
+
+The input is a CSV with an "address" column (and optionally "report_type"), or JSONL
+with one {"address": ..., "report_type": ...} object per line. Reports, a manifest.json
+and, with --zip, an archive of both are written to a folder per batch.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.utils import check_missing_values, generate_report, get_property_info, normalize_address
+
+# reports generated at the same time within one batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# most report workers a batch requested through the API may ask for
+BATCH_CONCURRENCY_MAX = int(os.getenv("BATCH_CONCURRENCY_MAX", "16"))
+BATCH_DIR = os.getenv("BATCH_DIR", os.path.join("reports", "batches"))
+REPORT_TYPES = ("buyer", "seller")
+# the values the web form fills in when Zillow has none, so batch reports match interactive ones
+FORM_DEFAULTS = {"days_on_market": 1, "Assessed_value": 1, "zestimate": 1, "Porperty_size": 1, "square_footage": 1,
+                 "totalBedrooms": 1, "totalBathrooms": 1, "totalMarketValue": 1}
+
+
+def read_batch(text, report_type="buyer", name=""):
+    """
+    Parse a CSV or JSONL address list.
+
+    Args:
+    - text (str): File contents.
+    - report_type (str): Used for rows without a report_type.
+    - name (str): File name, a .jsonl/.json extension selects JSONL, otherwise the contents decide.
+
+    Returns:
+    - list: {"line", "address", "report_type"} dicts in file order.
+    """
+    text = text.lstrip("\ufeff")
+    if name.lower().endswith((".jsonl", ".json")) or text.lstrip().startswith("{"):
+        rows = [(i, json.loads(line)) for i, line in enumerate(text.splitlines(), 1) if line.strip()]
+    else:
+        rows = list(enumerate(csv.DictReader(io.StringIO(text)), 2))
+    items = []
+    for line, row in rows:
+        row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        address = (row.get("address") or row.get("property_address") or "").strip()
+        if not address:
+            continue
+        items.append({"line": line, "address": address, "report_type": (row.get("report_type") or report_type).strip().lower()})
+    return items
+
+
+def prepare_data(info):
+    """Fill in the web form defaults for values Zillow didn't have."""
+    data = dict(info)
+    for key, default in FORM_DEFAULTS.items():
+        value = data.get(key)
+        if not isinstance(value, (int, float)) or value == 0:
+            data[key] = default
+    if not data.get("specifications") or data["specifications"] == "N/A":
+        data["specifications"] = "Not Available"
+    return data
+
+
+def run_item(item, output_dir, use_cache):
+    """
+    Returns:
+    - dict: Manifest entry, status being "done" (with the report file name), "invalid" or "failed" (with the error).
+    """
+    start = time.time()
+    result = {"address": item["address"], "report_type": item["report_type"], "line": item["line"]}
+    result.update(generate_item(item, output_dir, use_cache))
+    result["seconds"] = round(time.time() - start, 3)
+    return result
+
+
+def generate_item(item, output_dir, use_cache):
+    try:
+        if item["report_type"] not in REPORT_TYPES:
+            return {"status": "invalid", "error": "Invalid report type. Use 'buyer' or 'seller'."}
+        info = get_property_info(item["address"])
+        if info.get("error"):
+            return {"status": "invalid", "error": info["error"]}
+        data = prepare_data(info)
+        check = check_missing_values(data)
+        if check != True:
+            return {"status": "invalid", "error": check["status"], "missing_keys": check["missing_keys"]}
+        report_path = generate_report(item["report_type"], data, output_dir, use_cache=use_cache)
+        return {"status": "done", "report": os.path.basename(report_path)}
+    except Exception as e:
+        print("BATCH_ITEM_FAILED", item["address"], e)
+        return {"status": "failed", "error": str(e)}
+
+
+def run_batch(items, output_dir=None, concurrency=BATCH_CONCURRENCY, use_cache=True, make_zip=False, batch_id=None, progress=None):
+    """
+    Generate a report per item on a pool of workers and write the manifest.
+    Items repeating an address (in any spelling normalize_address accepts) and report type are
+    generated once. Properties, tax lookups and OpenAI answers are shared through the caches, and
+    concurrent requests for the same entry share one call.
+    Distinct properties share comparable searches through the comp tile cache (COMPS_CACHE_ENABLED,
+    on by default): one search per map tile and filter set. For-sale searches (and sold ones in the
+    "planned" COMP_SEARCH_MODE) have no bed/bath filter, so they are shared by every property in
+    the tile; filtered sold searches only by properties with the same bedrooms and bathrooms.
+    Properties in different tiles, in tiles too dense to cache, or with the tile cache off, each
+    search on their own.
+
+    Args:
+    - items (list): {"address", "report_type"} dicts, as returned by read_batch.
+    - output_dir (str): Folder for the reports and manifest, BATCH_DIR/<batch_id> by default.
+    - concurrency (int): Reports generated at the same time.
+    - use_cache (bool): Set to False to skip the OpenAI response cache.
+    - make_zip (bool): Also write <output_dir>.zip with the reports and the manifest.
+    - progress (callable): Called as progress("item_done", index=..., status=...) after each item.
+
+    Returns:
+    - dict: The manifest.
+    """
+    batch_id = batch_id or uuid.uuid4().hex
+    output_dir = output_dir or os.path.join(BATCH_DIR, batch_id)
+    os.makedirs(output_dir, exist_ok=True)
+    progress = progress or (lambda event, **info: None)
+    manifest = {"batch_id": batch_id, "created_at": time.time(), "output_dir": output_dir, "items": []}
+
+    unique = {}
+    for index, item in enumerate(items):
+        key = (normalize_address(item["address"]), item["report_type"])
+        unique.setdefault(key, []).append(index)
+    results = [None] * len(items)
+
+    def run_group(indexes):
+        result = run_item(items[indexes[0]], output_dir, use_cache)
+        for index in indexes:
+            # each row keeps its own spelling of the address, duplicates point at the row whose report they share
+            results[index] = dict(result, address=items[index]["address"], line=items[index]["line"],
+                                  duplicate_of=None if index == indexes[0] else items[indexes[0]]["line"])
+            progress("item_done", index=index, status=result["status"])
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch-worker") as pool:
+        list(pool.map(run_group, unique.values()))
+
+    manifest["items"] = results
+    manifest["finished_at"] = time.time()
+    manifest["counts"] = {status: sum(1 for result in results if result["status"] == status) for status in ("done", "failed", "invalid")}
+    manifest["unique"] = len(unique)
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    if make_zip:
+        manifest["zip"] = zip_batch(manifest, output_dir)
+    return manifest
+
+
+def zip_batch(manifest, output_dir):
+    """
+    Returns:
+    - str: Path of <output_dir>.zip, holding the manifest and every generated report.
+    """
+    zip_path = output_dir.rstrip("/\\") + ".zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.write(os.path.join(output_dir, "manifest.json"), "manifest.json", compress_type=zipfile.ZIP_DEFLATED)
+        # the PDFs are mostly JPEG data already, compressing them again only costs time
+        for report in sorted({item["report"] for item in manifest["items"] if item.get("report")}):
+            archive.write(os.path.join(output_dir, report), report, compress_type=zipfile.ZIP_STORED)
+    return zip_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or JSONL file of addresses")
+    parser.add_argument("--report-type", choices=REPORT_TYPES, default="buyer", help="for rows without a report_type")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--output", default=None, help="output folder, BATCH_DIR/<batch id> by default")
+    parser.add_argument("--zip", action="store_true", help="also write a zip archive of the reports and manifest")
+    parser.add_argument("--no-cache", action="store_true", help="ask OpenAI again instead of reusing cached answers")
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        items = read_batch(f.read(), args.report_type, args.input)
+    manifest = run_batch(items, args.output, args.concurrency, not args.no_cache, args.zip)
+    counts = manifest["counts"]
+    print(f"{len(items)} rows ({manifest['unique']} unique): {counts['done']} done, {counts['failed']} failed, {counts['invalid']} invalid")
+    print(f"manifest: {os.path.join(manifest['output_dir'], 'manifest.json')}")
+    if manifest.get("zip"):
+        print(f"zip: {manifest['zip']}")
+
+
+if __name__ == "__main__":
+    main()
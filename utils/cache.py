@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils.singleflight import Group
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+CACHE_DB = os.path.join(CACHE_DIR, "cache.sqlite")
+
+# every cache created in the process, by name, so their counters can be reported together
+CACHES = {}
+
+
+def make_key(*parts):
+    """
+    Build a stable cache key from JSON serializable parts.
+
+    Returns:
+    - str: sha256 hex digest of the parts.
+    """
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+class SQLiteCache:
+    """
+    Persistent key/value cache stored in SQLite, with a time-to-live and least recently used eviction.
+    Values must be JSON serializable.
+
+    Args:
+    - name (str): Cache name, also used as the table name.
+    - ttl (float): Seconds an entry stays valid.
+    - max_entries (int): Entries kept before the least recently used ones are evicted.
+    - path (str): SQLite file, shared by all caches by default.
+    """
+
+    def __init__(self, name, ttl, max_entries, path=CACHE_DB):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ready = False
+        CACHES[name] = self
+
+    def _connect(self):
+        # sqlite connections can't be shared between threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        if not self._ready:
+            with self._lock:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {self.name} (key TEXT PRIMARY KEY, value TEXT, created_at REAL, accessed_at REAL)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_accessed ON {self.name} (accessed_at)")
+                conn.commit()
+                self._ready = True
+        return conn
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, key):
+        """
+        Returns:
+        - tuple: (value, created_at) for a valid entry, None on a miss.
+        """
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(f"SELECT value, created_at FROM {self.name} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(False)
+            return None
+        value, created_at = row
+        if now - created_at > self.ttl:
+            conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+            conn.commit()
+            self._count(False)
+            return None
+        conn.execute(f"UPDATE {self.name} SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        self._count(True)
+        return json.loads(value), created_at
+
+    def get(self, key, default=None):
+        found = self.lookup(key)
+        return default if found is None else found[0]
+
+    def set(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.name} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now),
+        )
+        overflow = conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                f"DELETE FROM {self.name} WHERE key IN (SELECT key FROM {self.name} ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._connect()
+        conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+        conn.commit()
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute(f"DELETE FROM {self.name}")
+        conn.commit()
+
+    def stats(self):
+        entries = self._connect().execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+
+
+class TieredCache:
+    """
+    In-memory LRU cache in front of a SQLiteCache, so hot entries skip SQLite and
+    everything survives a restart. Concurrent get_or_load calls for the same key
+    share a single load (across worker processes too with SINGLEFLIGHT_PROCESSES=1).
+
+    Args:
+    - name (str): Cache name, also used as the SQLite table name.
+    - ttl (float): Seconds an entry stays valid, in both tiers.
+    - max_entries (int): Entries kept on disk.
+    - memory_entries (int): Entries kept in memory.
+    """
+
+    def __init__(self, name, ttl, max_entries, memory_entries=256, path=CACHE_DB):
+        self.name = name
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk = SQLiteCache(name, ttl, max_entries, path)
+        self.memory_hits = 0
+        self._memory = OrderedDict()
+        self._flights = Group(name)
+        self._lock = threading.Lock()
+        CACHES[name] = self
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+        found = self.disk.lookup(key)
+        if found is None:
+            return default
+        self._remember(key, *found)
+        return found[0]
+
+    def set(self, key, value):
+        self._remember(key, value, time.time())
+        self.disk.set(key, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        self.disk.delete(key)
+
+    def get_or_load(self, key, loader, refresh=False):
+        """
+        Return the cached value for key, or call loader() once and cache its result.
+        Callers asking for a key that is already being loaded wait for that load instead
+        of starting their own. None results are returned but not cached.
+
+        Args:
+        - key (str): Cache key.
+        - loader (callable): Fetches the value on a miss.
+        - refresh (bool): Skip the cached value and load a fresh one.
+        """
+        if not refresh:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+        def load():
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+            return value
+
+        # the previous load (in this or another process) may have stored the value since the lookup above
+        return self._flights.do(key, load, recheck=None if refresh else lambda: self.get(key))
+
+    def _remember(self, key, value, created_at):
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        stats = self.disk.stats()
+        stats["memory_hits"] = self.memory_hits
+        stats["memory_entries"] = len(self._memory)
+        total = self.memory_hits + stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = (self.memory_hits + stats["hits"]) / total if total else 0.0
+        return stats
@@ -0,0 +1,274 @@
+from math import radians, sin, cos, sqrt, atan2
+
+
+class Comp:
+    """
+    One comparable listing from a Zillow search, read once from the searchResults payload.
+    Missing values are None; the formatters, pricing and the PDF all read these fields
+    instead of going back to the payload or parsing formatted text.
+
+    - living_sqft, lot_sqft (float): Living area and lot size in sq ft (values under 10 are taken as acres).
+    - distance (float): Miles from the subject property, None without a location.
+    - missing_score (float): Weight of the missing fields, beds/baths 0.5 each, living area 2, lot size 1.
+    - details (list): (label, value) rows shown in the PDF, set by the formatter that selected the comp.
+    """
+    __slots__ = ("zpid", "address", "status", "price", "zestimate", "bedrooms", "bathrooms", "living_area", "lot_size",
+                 "living_sqft", "lot_sqft", "year_built", "tax_assessed", "photo_link", "last_sold_date", "days_on_zillow",
+                 "latitude", "longitude", "distance", "missing_score", "details")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+
+def _get(value, *path):
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def read_comp(item, latitude=None, longitude=None):
+    """
+    Args:
+    - item (dict): One entry of a search's searchResults.
+    - latitude, longitude (float): Subject property location, used for the distance.
+
+    Returns:
+    - Comp: The listing as a record.
+    """
+    prop = item.get('property') or {}
+    parts = [_get(prop, 'address', key) for key in ('streetAddress', 'city', 'state', 'zipcode')]
+    comp = Comp(
+        zpid=prop.get('zpid'),
+        address=None if None in parts else f"{parts[0]}, {parts[1]}, {parts[2]} {parts[3]}",
+        status=_get(prop, 'listing', 'listingStatus'),
+        price=_get(prop, 'price', 'value'),
+        zestimate=_get(prop, 'estimates', 'zestimate'),
+        bedrooms=prop.get('bedrooms'),
+        bathrooms=prop.get('bathrooms'),
+        living_area=prop.get('livingArea'),
+        lot_size=_get(prop, 'lotSizeWithUnit', 'lotSize'),
+        year_built=prop.get('yearBuilt'),
+        tax_assessed=_get(prop, 'taxAssessment', 'taxAssessedValue'),
+        photo_link=_get(prop, 'media', 'propertyPhotoLinks', 'mediumSizeLink'),
+        last_sold_date=prop.get('lastSoldDate'),
+        days_on_zillow=prop.get('daysOnZillow'),
+        latitude=_get(prop, 'location', 'latitude'),
+        longitude=_get(prop, 'location', 'longitude'),
+        # fields absent from the payload, a null value counts as present
+        missing_score=0.5 * ('bedrooms' not in prop) + 0.5 * ('bathrooms' not in prop) + 2 * ('livingArea' not in prop) + 1 * ('lotSizeWithUnit' not in prop),
+    )
+    comp.living_sqft = convert_lot_size(comp.living_area)
+    comp.lot_sqft = convert_lot_size(comp.lot_size)
+    if None not in (latitude, longitude, comp.latitude, comp.longitude):
+        try:
+            comp.distance = calculate_distance_miles(latitude, longitude, comp.latitude, comp.longitude)
+        except (TypeError, ValueError):
+            pass
+    return comp
+
+
+def read_comps(data, latitude=None, longitude=None):
+    """
+    Read every listing of a search response in one pass.
+
+    Returns:
+    - list: A Comp per entry of data['searchResults'], in order; empty when there is no response.
+    """
+    if not data:
+        return []
+    return [read_comp(item, latitude, longitude) for item in data.get('searchResults') or [] if isinstance(item, dict)]
+
+
+# columns of CompTable, all float64 with NaN for missing values
+COMP_COLUMNS = ("latitude", "longitude", "price", "bedrooms", "bathrooms", "living_sqft", "lot_sqft", "year_built", "missing_score")
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return float("nan")
+    if isinstance(value, (int, float)):
+        return float(value)
+    converted = safe_convert(value)
+    return float("nan") if converted is None else converted
+
+
+class CompTable:
+    """
+    Columnar view of many search results (a whole tile, zip code or batch of searches) for
+    filtering and ranking them with NumPy instead of one listing at a time. The results are
+    read once into float arrays, distance, price per sq ft and the missing-field score are
+    computed for all rows at once; only the rows that are kept are read into Comp records.
+
+    Args:
+    - results (list): searchResults entries.
+    - latitude, longitude (float): Subject property location, distances are NaN without one.
+    """
+
+    def __init__(self, results, latitude=None, longitude=None):
+        import numpy as np
+
+        self.results = [item for item in results or [] if isinstance(item, dict)]
+        rows = []
+        statuses = []
+        for item in self.results:
+            prop = item.get('property') or {}
+            rows.append((
+                _number(_get(prop, 'location', 'latitude')),
+                _number(_get(prop, 'location', 'longitude')),
+                _number(_get(prop, 'price', 'value')),
+                _number(prop.get('bedrooms')),
+                _number(prop.get('bathrooms')),
+                _number(prop.get('livingArea')),
+                _number(_get(prop, 'lotSizeWithUnit', 'lotSize')),
+                _number(prop.get('yearBuilt')),
+                0.5 * ('bedrooms' not in prop) + 0.5 * ('bathrooms' not in prop) + 2 * ('livingArea' not in prop) + 1 * ('lotSizeWithUnit' not in prop),
+            ))
+            statuses.append(_get(prop, 'listing', 'listingStatus'))
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), len(COMP_COLUMNS))
+        for i, name in enumerate(COMP_COLUMNS):
+            setattr(self, name, table[:, i])
+        self.for_sale = np.array([status == "forSale" for status in statuses], dtype=bool)
+        # values under 10 are taken as acres, as convert_lot_size does
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.living_sqft = np.where(self.living_sqft < 10, self.living_sqft * 43560, self.living_sqft)
+            self.lot_sqft = np.where(self.lot_sqft < 10, self.lot_sqft * 43560, self.lot_sqft)
+            self.price_per_sqft = np.where(self.living_sqft > 0, self.price / self.living_sqft, np.nan)
+        if latitude is None or longitude is None:
+            self.distance = np.full(len(self.results), np.nan)
+        else:
+            self.distance = haversine_miles(float(latitude), float(longitude), self.latitude, self.longitude)
+
+    def __len__(self):
+        return len(self.results)
+
+    def mask(self, radius=None, max_beds=None, min_baths=None, for_sale=None, max_missing_score=None):
+        """
+        Rows matching every given filter; rows missing a filtered value never match.
+
+        Args:
+        - radius (float): Most miles from the subject.
+        - max_beds (float): Most bedrooms, like the search's bed_max.
+        - min_baths (float): Fewest bathrooms, like the search's bathrooms filter.
+        - for_sale (bool): True for listings for sale, False for the others (sold).
+        - max_missing_score (float): Highest missing-field score kept.
+
+        Returns:
+        - numpy.ndarray: Boolean mask over the rows.
+        """
+        import numpy as np
+
+        keep = np.ones(len(self.results), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            if radius is not None:
+                keep &= self.distance <= radius
+            if max_beds is not None:
+                keep &= self.bedrooms <= max_beds
+            if min_baths is not None:
+                keep &= self.bathrooms >= min_baths
+            if max_missing_score is not None:
+                keep &= self.missing_score <= max_missing_score
+        if for_sale is not None:
+            keep &= self.for_sale if for_sale else ~self.for_sale
+        return keep
+
+    def top(self, n, mask=None, key="distance", descending=False):
+        """
+        Indexes of the best n rows by a column, rows without a value last, ties in result order.
+
+        Args:
+        - n (int): Rows wanted.
+        - mask (numpy.ndarray): Only rank these rows, e.g. from mask().
+        - key (str): Column to rank by: "distance", "price_per_sqft", "missing_score" or one of COMP_COLUMNS.
+        - descending (bool): Highest values first.
+
+        Returns:
+        - numpy.ndarray: Row indexes, best first.
+        """
+        import numpy as np
+
+        rows = np.arange(len(self.results)) if mask is None else np.flatnonzero(mask)
+        values = getattr(self, key)[rows]
+        values = -values if descending else values
+        values = np.where(np.isnan(values), np.inf, values)
+        if 0 < n < len(rows):
+            # only the n smallest need sorting
+            part = np.argpartition(values, n - 1)[:n]
+            cutoff = values[part].max()
+            # keep every row tied with the cutoff so the stable sort picks the earliest ones
+            part = np.flatnonzero(values <= cutoff)
+            order = part[np.argsort(values[part], kind="stable")][:n]
+        else:
+            order = np.argsort(values, kind="stable")[:max(n, 0)]
+        return rows[order]
+
+    def select(self, indexes):
+        """searchResults entries of the given rows, in that order."""
+        return [self.results[i] for i in indexes]
+
+
+def haversine_miles(latitude, longitude, latitudes, longitudes):
+    """calculate_distance_miles from one point to arrays of points, NaN where a location is missing."""
+    import numpy as np
+
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 3958.8 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def calculate_distance_miles(lat1, lon1, lat2, lon2):
+    """
+    Calculate the distance between two points (A and B) on Earth using the Haversine formula.
+
+    Args:
+    - lat1, lon1: Latitude and Longitude of point A (in decimal degrees).
+    - lat2, lon2: Latitude and Longitude of point B (in decimal degrees).
+
+    Returns:
+    - Distance in miles (float).
+    """
+    # Radius of the Earth in miles
+    R = 3958.8
+
+    # Convert latitude and longitude from degrees to radians
+    lat1_rad, lon1_rad = radians(lat1), radians(lon1)
+    lat2_rad, lon2_rad = radians(lat2), radians(lon2)
+
+    # Haversine formula
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+
+    # Distance in miles
+    distance = R * c
+    return distance
+
+
+def safe_convert(value):
+    """
+    Convert a value to float.
+    Handles strings by removing '$' and commas, and returns None for invalid data.
+    """
+    try:
+        if isinstance(value, str):
+            value = value.replace('$', '').replace(',', '').replace(' sq ft','').strip()
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def convert_lot_size(value):
+    """
+    Convert lot size value to square feet.
+    If the numeric value is less than 10, assume it's in acres and convert to sqft.
+    Otherwise, assume it's already in sqft.
+    """
+    num = safe_convert(value)
+    if num is None:
+        return None
+    return num * 43560 if num < 10 else num
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import metrics, tracing
+
+# there is no async variant: the concurrent paths (comp levels, photo prefetch, OpenAI prompts, batch
+# items) run get() on thread pools, and the API hands report work to JobQueue threads, so every call
+# already runs off the event loop and shares this session's connection pool
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+# keep-alive connections kept per host
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# one session retries 429/5xx responses itself, the other leaves that to the caller
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+def get_session(retry_status=True):
+    """
+    Shared requests session used for every outbound call, created on first use.
+    Connections are pooled and kept alive per host, and GETs answered with 429 or 5xx
+    are retried with exponential backoff (honouring Retry-After).
+
+    Args:
+    - retry_status (bool): Set to False for a session that retries failed connections only,
+      for callers that count or rate limit every request they send and retry responses themselves.
+    """
+    session = _sessions.get(retry_status)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(retry_status)
+            if session is None:
+                retry = Retry(
+                    total=HTTP_RETRIES,
+                    # a read error may come after the request was sent, only retry it with the responses
+                    read=None if retry_status else 0,
+                    backoff_factor=0.5,
+                    status_forcelist=RETRY_STATUSES if retry_status else (),
+                    allowed_methods=frozenset(["GET"]),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[retry_status] = session
+    return session
+
+
+def get(url, timeout=None, upstream=None, retry_status=True, **kwargs):
+    """
+    GET a URL through the shared session.
+
+    Args:
+    - url (str): URL to fetch.
+    - timeout (tuple): (connect, read) timeout in seconds, defaults to HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT.
+    - upstream (str): Name the call is counted under in metrics and traces, defaults to the host name.
+    - retry_status (bool): Retry 429/5xx responses here, see get_session.
+    - kwargs: Passed on to requests (headers, params, stream, ...).
+
+    Returns:
+    - requests.Response: The last response, also when retries ran out on a 429/5xx.
+    """
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    upstream = upstream or urlsplit(url).hostname
+    start = time.perf_counter()
+    try:
+        response = get_session(retry_status).get(url, timeout=timeout, **kwargs)
+    except Exception:
+        metrics.upstream_requests.inc(upstream=upstream, status="error")
+        raise
+    finally:
+        metrics.upstream_request_duration.observe(time.perf_counter() - start, upstream=upstream)
+    metrics.upstream_requests.inc(upstream=upstream, status=response.status_code)
+    # streamed bodies aren't read here, only the call is counted
+    nbytes = 0 if kwargs.get("stream") else len(response.content)
+    tracing.record_call(upstream, nbytes)
+    return response
+
@@ -1,7 +1,8 @@
 import os
-from PIL import Image
 
 def process_image(image_path: str, output_dir: str = "downloads") -> str:
+    from PIL import Image
+
     try:
         os.makedirs(output_dir, exist_ok=True)
         with Image.open(image_path) as img:
@@ -16,5 +17,8 @@ def process_image(image_path: str, output_dir: str = "downloads") -> str:
     except Exception as e:
         print(f"Error processing image: {e}")
         return ""
-    
-process_image1 = process_image("utils/const1.png")
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    # regenerates const1.jpg (the photo placeholder) from utils/const1.png
+    process_image("utils/const1.png")
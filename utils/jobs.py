@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.tracing import Trace
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "4"))
+# finished jobs are kept around this long (seconds) so clients can poll them
+REPORT_JOB_TTL = int(os.getenv("REPORT_JOB_TTL", "3600"))
+
+
+class Job:
+    def __init__(self, report_type, data, options=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.report_type = report_type
+        self.data = data
+        self.options = options or {}
+        self.status = "queued"  # queued -> running -> done / failed
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.trace = Trace()
+        # progress events in the order they happened, their index is their id
+        self.events = []
+        self._events_lock = threading.Lock()
+        self.add_event("queued")
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def release_result(self):
+        """
+        Drop the result and the finished future that also holds it, e.g. once a streamed PDF was sent.
+        The job stays available for polling with its status, events and timings.
+        """
+        self.result = None
+        self.future = None
+
+    def add_event(self, event, **info):
+        with self._events_lock:
+            self.events.append({"id": len(self.events), "event": event, "time": time.time(), **info})
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "report_type": self.report_type,
+            "address": self.data.get("address"),
+            "status": self.status,
+            "progress": self.events[-1]["event"],
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": self.trace.summary() if self.started_at else None,
+        }
+
+
+class JobQueue:
+    """
+    Runs report jobs on a pool of background worker threads.
+
+    Args:
+    - run (callable): Called as run(report_type, data, trace=job.trace, progress=job.add_event, **options) inside a worker; its return value becomes the job result.
+    - workers (int): Number of reports generated at the same time.
+    """
+
+    def __init__(self, run, workers=REPORT_WORKERS):
+        self._run = run
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-worker")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.workers = workers
+
+    def submit(self, report_type, data, job_id=None, **options):
+        job = Job(report_type, data, options, job_id)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        job.future = self._pool.submit(self._execute, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        for job in jobs:
+            counts[job.status] += 1
+        counts["workers"] = self.workers
+        return counts
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def _execute(self, job):
+        job.status = "running"
+        job.started_at = time.time()
+        job.add_event("running")
+        try:
+            job.result = self._run(job.report_type, job.data, trace=job.trace, progress=job.add_event, **job.options)
+            job.status = "done"
+            return job.result
+        except Exception as e:
+            print("REPORT_JOB_FAILED", job.id, e)
+            job.error = str(e)
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = time.time()
+            job.add_event(job.status)
+
+    def _prune(self):
+        # caller holds the lock
+        cutoff = time.time() - REPORT_JOB_TTL
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
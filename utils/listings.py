@@ -0,0 +1,213 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from math import cos, floor, radians
+
+from utils import metrics
+from utils.cache import CACHE_DIR
+from utils.comps import CompTable, calculate_distance_miles
+
+# every listing seen by a comparable search, in its own SQLite file shared by the worker processes
+LISTINGS_DB = os.path.join(CACHE_DIR, "listings.sqlite")
+# side of the grid cells listings are indexed by, in degrees (0.005 is about a third of a mile)
+LISTING_CELL_SIZE = float(os.getenv("LISTING_CELL_SIZE", "0.005"))
+# widest search kept as coverage; bigger circles are stored but never used to answer locally
+LISTING_MAX_SEARCH_RADIUS = 10
+MILES_PER_DEGREE = 69.0
+# fresh listings passing a search's filters within its radius that let the store answer it without
+# an earlier search covering the area, enough for the six comps a report shows after it drops the incomplete ones
+LISTING_STORE_MIN_LISTINGS = int(os.getenv("LISTING_STORE_MIN_LISTINGS", "12"))
+# bathrooms filter values with their minimum
+BATHROOM_FILTERS = {"OnePlus": 1, "TwoPlus": 2, "ThreePlus": 3, "FourPlus": 4}
+
+listing_store_lookups = metrics.Counter(
+    "listing_store_lookups_total", "Comparable searches answered from the local listing store (hit) or sent upstream (miss).", ("status", "result"))
+
+
+def search_filters(querystring):
+    """
+    Read a search/bycoordinates query.
+
+    Returns:
+    - dict: status, latitude, longitude, radius (miles), max_beds and min_baths (None when not filtered).
+    """
+    bed_max = str(querystring.get("bed_max", ""))
+    return {
+        "status": querystring.get("listingStatus"),
+        "latitude": float(querystring["latitude"]),
+        "longitude": float(querystring["longitude"]),
+        "radius": float(querystring.get("radius") or 1),
+        "max_beds": int(bed_max) if bed_max.isdigit() else None,
+        "min_baths": BATHROOM_FILTERS.get(querystring.get("bathrooms")),
+    }
+
+
+class ListingStore:
+    """
+    Local store of the listings returned by comparable searches, indexed on a latitude/longitude
+    grid so radius and nearest-neighbour queries only read the cells around the subject.
+    It also remembers the area and filters each search covered, so a later search that lies
+    inside an earlier, still fresh one can be answered without going upstream.
+
+    Args:
+    - path (str): SQLite file.
+    - cell_size (float): Grid cell side in degrees.
+    """
+
+    def __init__(self, path=LISTINGS_DB, cell_size=LISTING_CELL_SIZE):
+        self.path = path
+        self.cell_size = cell_size
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS listings (zpid TEXT, status TEXT, cell_lat INTEGER, cell_lon INTEGER, latitude REAL, longitude REAL,"
+                " bedrooms REAL, bathrooms REAL, payload TEXT, seen_at REAL, PRIMARY KEY (zpid, status))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS listings_cell ON listings (status, cell_lat, cell_lon)")
+            conn.execute("CREATE INDEX IF NOT EXISTS listings_seen ON listings (status, seen_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS searches (status TEXT, latitude REAL, longitude REAL, radius REAL,"
+                " max_beds INTEGER, min_baths INTEGER, searched_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS searches_area ON searches (status, latitude)")
+            self._local.conn = conn
+        return conn
+
+    def cell(self, latitude, longitude):
+        return floor(latitude / self.cell_size), floor(longitude / self.cell_size)
+
+    def _cell_range(self, latitude, longitude, radius):
+        # cells of the bounding box around the circle, longitude degrees shrink away from the equator
+        d_lat = radius / MILES_PER_DEGREE
+        d_lon = radius / (MILES_PER_DEGREE * max(cos(radians(latitude)), 0.01))
+        low = self.cell(latitude - d_lat, longitude - d_lon)
+        high = self.cell(latitude + d_lat, longitude + d_lon)
+        return low[0], high[0], low[1], high[1]
+
+    def record_search(self, querystring, data, max_age):
+        """
+        Store the listings of a search/bycoordinates response and the area it covered.
+        Searches that may have been cut short (more matches than results, or no total reported) add
+        their listings but no coverage.
+        Listings and searches of the same status older than max_age are dropped.
+
+        Args:
+        - querystring (dict): The search query.
+        - data (dict): The search response.
+        - max_age (float): Seconds listings of this status stay usable.
+        """
+        search = search_filters(querystring)
+        results = [item for item in (data or {}).get("searchResults") or [] if isinstance(item, dict)]
+        total = ((data or {}).get("resultsCount") or {}).get("totalMatchingCount")
+        complete = isinstance(total, int) and total <= len(results)
+        now = time.time()
+        rows = []
+        for item in results:
+            prop = item.get("property") or {}
+            location = prop.get("location") or {}
+            latitude, longitude = location.get("latitude"), location.get("longitude")
+            if prop.get("zpid") is None or not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+                continue
+            cell_lat, cell_lon = self.cell(latitude, longitude)
+            rows.append((str(prop["zpid"]), search["status"], cell_lat, cell_lon, latitude, longitude,
+                         prop.get("bedrooms"), prop.get("bathrooms"), json.dumps(item), now))
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if complete:
+                conn.execute("INSERT INTO searches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (search["status"], search["latitude"], search["longitude"], search["radius"], search["max_beds"], search["min_baths"], now))
+            conn.execute("DELETE FROM listings WHERE status = ? AND seen_at < ?", (search["status"], now - max_age))
+            conn.execute("DELETE FROM searches WHERE status = ? AND searched_at < ?", (search["status"], now - max_age))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def covers(self, status, latitude, longitude, radius, max_beds=None, min_baths=None, max_age=None):
+        """
+        Whether a search done within max_age seconds returned every listing of status within radius
+        miles of the point that passes the bed/bath filters, i.e. its circle contains this one and
+        its own filters were no stricter.
+        """
+        since = time.time() - max_age if max_age is not None else 0
+        d_lat = LISTING_MAX_SEARCH_RADIUS / MILES_PER_DEGREE
+        rows = self._connect().execute(
+            "SELECT latitude, longitude, radius, max_beds, min_baths FROM searches"
+            " WHERE status = ? AND latitude BETWEEN ? AND ? AND searched_at >= ? AND radius >= ?",
+            (status, latitude - d_lat, latitude + d_lat, since, radius),
+        ).fetchall()
+        for search_lat, search_lon, search_radius, search_beds, search_baths in rows:
+            if search_beds is not None and (max_beds is None or max_beds > search_beds):
+                continue
+            if search_baths is not None and (min_baths is None or min_baths < search_baths):
+                continue
+            if calculate_distance_miles(latitude, longitude, search_lat, search_lon) + radius <= search_radius:
+                return True
+        return False
+
+    def within(self, status, latitude, longitude, radius, max_beds=None, min_baths=None, max_age=None, limit=None):
+        """
+        Listings of status within radius miles of the point, nearest first.
+
+        Returns:
+        - list: Their searchResults entries, as the search returned them.
+        """
+        low_lat, high_lat, low_lon, high_lon = self._cell_range(latitude, longitude, radius)
+        query = ("SELECT payload FROM listings WHERE status = ? AND cell_lat BETWEEN ? AND ? AND cell_lon BETWEEN ? AND ?"
+                 " AND seen_at >= ?")
+        params = [status, low_lat, high_lat, low_lon, high_lon, time.time() - max_age if max_age is not None else 0]
+        if max_beds is not None:
+            query += " AND bedrooms <= ?"
+            params.append(max_beds)
+        if min_baths is not None:
+            query += " AND bathrooms >= ?"
+            params.append(min_baths)
+        rows = self._connect().execute(query, params).fetchall()
+        table = CompTable([json.loads(payload) for payload, in rows], latitude, longitude)
+        return table.select(table.top(len(table) if limit is None else limit, table.mask(radius=radius)))
+
+    def nearest(self, status, latitude, longitude, k, max_beds=None, min_baths=None, max_age=None, max_radius=LISTING_MAX_SEARCH_RADIUS):
+        """
+        The k listings of status nearest the point (within max_radius miles), nearest first.
+        The search circle starts at one grid cell and doubles until it holds k listings.
+        """
+        radius = self.cell_size * MILES_PER_DEGREE
+        while True:
+            radius = min(radius, max_radius)
+            found = self.within(status, latitude, longitude, radius, max_beds, min_baths, max_age, limit=k)
+            if len(found) >= k or radius >= max_radius:
+                return found
+            radius *= 2
+
+
+listing_store = ListingStore()
+
+
+def local_search(querystring, max_age):
+    """
+    Answer a search/bycoordinates query from the listing store when an earlier search covered it,
+    or when the store holds at least LISTING_STORE_MIN_LISTINGS fresh listings within the radius that
+    pass its filters (e.g. seen by the searches of neighbouring subjects).
+
+    Returns:
+    - dict: A search response with the matching listings nearest first, or None when the query has to go upstream.
+    """
+    search = search_filters(querystring)
+    args = (search["status"], search["latitude"], search["longitude"], search["radius"], search["max_beds"], search["min_baths"], max_age)
+    if not listing_store.covers(*args):
+        nearby = listing_store.nearest(search["status"], search["latitude"], search["longitude"], LISTING_STORE_MIN_LISTINGS,
+                                       search["max_beds"], search["min_baths"], max_age, max_radius=search["radius"])
+        if len(nearby) < LISTING_STORE_MIN_LISTINGS:
+            return None
+    results = listing_store.within(*args)
+    return {"searchResults": results, "resultsCount": {"totalMatchingCount": len(results)}}
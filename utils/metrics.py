@@ -0,0 +1,137 @@
+import threading
+
+# seconds, covers fast cache hits up to a slow OpenAI reasoning request
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# bytes, reports are usually between a few hundred KB and a few MB
+SIZE_BUCKETS = (100_000, 250_000, 500_000, 1_000_000, 2_000_000, 5_000_000, 10_000_000, 25_000_000)
+
+# every metric created in the process, in the order they are rendered
+REGISTRY = []
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram, rendered as _bucket, _sum and _count series.
+
+    Args:
+    - buckets (tuple): Upper bounds of the buckets, +Inf is added.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + "_bucket", key, ("le", _format_value(bound)), count))
+                samples.append((self.name + "_sum", key, None, total))
+                samples.append((self.name + "_count", key, None, counts[-1]))
+        return samples
+
+
+def render():
+    """
+    Returns:
+    - str: Every registered metric in the Prometheus text exposition format.
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "API request latency by endpoint.", ("method", "endpoint", "status"))
+upstream_requests = Counter(
+    "upstream_requests_total", "Calls to upstream services (rapidapi, openai, images) by outcome.", ("upstream", "status"))
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds", "Upstream call latency, including retries.", ("upstream",))
+cache_hit_ratio = Gauge(
+    "cache_hit_ratio", "Share of cache lookups answered from the cache since startup.", ("cache",))
+cache_entries = Gauge(
+    "cache_entries", "Entries stored in each cache.", ("cache",))
+reports_in_flight = Gauge(
+    "reports_in_flight", "Reports being generated right now.")
+reports = Counter(
+    "reports_total", "Reports generated, by type and outcome.", ("report_type", "status"))
+report_size = Histogram(
+    "report_size_bytes", "Size of the generated PDF reports.", ("report_type",), buckets=SIZE_BUCKETS)
@@ -0,0 +1,152 @@
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import metrics
+from utils.cache import CACHE_DIR
+
+# token buckets live in their own SQLite file so every worker process on the host shares them
+RATE_LIMIT_DB = os.path.join(CACHE_DIR, "rate_limit.sqlite")
+
+rate_limit_queued = metrics.Counter(
+    "rate_limit_queued_total", "Calls that waited for a rate limit token.", ("limiter",))
+rate_limit_wait = metrics.Histogram(
+    "rate_limit_wait_seconds", "Time calls waited for a rate limit token.", ("limiter",))
+rate_limit_rejected = metrics.Counter(
+    "rate_limit_rejected_total", "Calls not made: queue_timeout when no token came in time, budget when a report's call budget was spent.", ("limiter", "reason"))
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket stored in SQLite, so the rate is shared by every thread and process using the same file.
+
+    Args:
+    - name (str): Bucket name, one row per name.
+    - rate (float): Tokens added per second, 0 disables the limit.
+    - burst (float): Most tokens the bucket holds.
+    - queue_timeout (float): Seconds a call waits for a token before RateLimitExceeded is raised.
+    """
+
+    def __init__(self, name, rate, burst, queue_timeout=30, path=RATE_LIMIT_DB):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.queue_timeout = queue_timeout
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # autocommit, transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)")
+            self._local.conn = conn
+        return conn
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens if the bucket has them.
+
+        Returns:
+        - float: 0 when the tokens were taken, otherwise the seconds until they will be available.
+        """
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes can't spend the same tokens
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated_at FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            available = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            wait = 0.0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / self.rate
+            conn.execute("INSERT OR REPLACE INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?)", (self.name, available, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self, tokens=1):
+        """Wait for tokens, raising RateLimitExceeded when they don't come within queue_timeout."""
+        if self.rate <= 0:
+            return
+        start = time.time()
+        queued = False
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                if queued:
+                    rate_limit_wait.observe(time.time() - start, limiter=self.name)
+                return
+            if not queued:
+                queued = True
+                rate_limit_queued.inc(limiter=self.name)
+            if time.time() - start + wait > self.queue_timeout:
+                rate_limit_rejected.inc(limiter=self.name, reason="queue_timeout")
+                raise RateLimitExceeded(f"{self.name} rate limit: no token within {self.queue_timeout}s")
+            time.sleep(wait)
+
+
+class CallBudget:
+    """
+    Upstream calls a single report may make. Calls are counted, not refused; optional
+    calls (extra comp relaxation levels) check remaining() first and are skipped when it runs out.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def charge(self, calls=1):
+        with self._lock:
+            self.used += calls
+
+    def remaining(self):
+        with self._lock:
+            return max(0, self.limit - self.used)
+
+
+# budget of the report being generated; copied into worker threads with the tracing context
+_current_budget = contextvars.ContextVar("call_budget", default=None)
+
+
+@contextmanager
+def use_budget(budget):
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def current_budget():
+    return _current_budget.get()
+
+
+def charge_budget(calls=1):
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.charge(calls)
+
+
+def budget_remaining():
+    """
+    Returns:
+    - int: Calls left in the current report's budget, None when there is no budget.
+    """
+    budget = _current_budget.get()
+    return None if budget is None else budget.remaining()
@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils import tracing
+
+# processes laying out and encoding PDFs, 0 renders in the thread generating the report
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", "0"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def report_model(report_type, main_data, main_image, pricing, comparable_data, photos_past, source_links_past,
+                 current_data, photos_current, source_links_current, tag, recommendation, additional_consideration,
+                 output_path, past_market_grid, on_market_grid):
+    """
+    Everything the buyer and seller renderers need, as plain picklable values, so the PDF can be
+    laid out in another process. Photos are prefetched ReportImages (JPEG bytes) or image file paths.
+
+    Returns:
+    - dict: The report model.
+    """
+    return {
+        "report_type": report_type,
+        "main_data": main_data,
+        "main_image": main_image,
+        "pricing": pricing,
+        "comparable_data": comparable_data,
+        "photos_past": photos_past,
+        "source_links_past": source_links_past,
+        "current_data": current_data,
+        "photos_current": photos_current,
+        "source_links_current": source_links_current,
+        "tag": tag,
+        "recommendation": recommendation,
+        "additional_consideration": additional_consideration,
+        "output_path": output_path,
+        "past_market_grid": past_market_grid,
+        "on_market_grid": on_market_grid,
+    }
+
+
+def render_model(model):
+    """
+    Returns:
+    - str: Path of the written report, or bytes: the PDF itself when the model has no output_path.
+    """
+    from utils.rep_gen import generate_buyer_report, generate_report_seller
+
+    render = generate_buyer_report if model["report_type"] == "buyer" else generate_report_seller
+    return render(model["main_data"], model["main_image"], model["pricing"], model["comparable_data"], model["photos_past"],
+                  model["source_links_past"], model["current_data"], model["photos_current"], model["source_links_current"],
+                  model["tag"], model["recommendation"], model["additional_consideration"], model["output_path"],
+                  model["past_market_grid"], model["on_market_grid"])
+
+
+def _render_traced(model):
+    # runs in a pool process, its stage timings are sent back with the result
+    trace = tracing.Trace()
+    with tracing.use_trace(trace):
+        result = render_model(model)
+    return result, trace.summary()["stages"]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork, the parent runs request and prefetch threads
+            _pool = ProcessPoolExecutor(max_workers=RENDER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _drop_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def render_report(model):
+    """
+    Render a report model on the render process pool (RENDER_PROCESSES), or in the calling
+    thread when the pool is disabled. FPDF layout holds the GIL, so the pool is what lets
+    reports render on more than one core at a time.
+
+    Returns:
+    - str: Path of the written report, or bytes: the PDF itself when the model has no output_path.
+    """
+    if RENDER_PROCESSES <= 0:
+        return render_model(model)
+    pool = _get_pool()
+    try:
+        result, stages = pool.submit(_render_traced, model).result()
+    except BrokenProcessPool as e:
+        # a worker died (e.g. killed for memory); start a fresh pool next time and render this one here
+        print("RENDER_POOL_BROKEN", e)
+        _drop_pool(pool)
+        return render_model(model)
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.add_stages(stages)
+    return result
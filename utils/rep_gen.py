@@ -1,8 +1,10 @@
 from fpdf import FPDF
 import re
-import requests
+import io
 import os
-from PIL import Image
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from utils import http_client, tracing
 import random
 
 def format_address(address):
@@ -10,39 +12,108 @@ def format_address(address):
     address = address.replace("#", "_HASH_")        # Replace '#' with '-' or another safe character
     return address
 
-def download_image(image_url: str, save_dir: str = "downloads", filename: str = None) -> str:
-    os.makedirs(save_dir, exist_ok=True)
-    if not filename:
-        filename = os.path.basename(image_url.split("?")[0])
-    file_path = os.path.join(save_dir, filename)
-
-    try:
-        response = requests.get(image_url, stream=True)
-        response.raise_for_status()
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(1024):
-                f.write(chunk)
-        return file_path
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to download image: {e}")
-        return ""
-
-def process_image(image_path: str, output_dir: str = "downloads") -> str:
+# used in place of any photo that can't be downloaded or decoded
+FALLBACK_IMAGE = "const1.jpg"
+IMAGE_PREFETCH_WORKERS = int(os.getenv("IMAGE_PREFETCH_WORKERS", "8"))
+# seconds allowed to connect and to read each photo
+IMAGE_TIMEOUT = float(os.getenv("IMAGE_TIMEOUT", "15"))
+
+class ReportImage:
+    """
+    JPEG encoded image kept in memory, ready to embed in the PDF.
+    Holds plain bytes and its pixel size so no temp file or second decode is needed.
+    """
+    __slots__ = ("data", "width", "height")
+
+    def __init__(self, data, width, height):
+        self.data = data
+        self.width = width
+        self.height = height
+
+    def stream(self):
+        return io.BytesIO(self.data)
+
+def fetch_image(image_url: str, timeout: float = None) -> bytes:
+    response = http_client.get(image_url, timeout=timeout and (timeout, timeout), upstream="images")
+    response.raise_for_status()
+    return response.content
+
+def prepare_image(raw: bytes, size=(1280, 720)) -> ReportImage:
+    """Decode an image once, resize it and encode it once as JPEG."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(raw)) as img:
+        resized_img = img.resize(size)
+    if resized_img.mode != 'RGB':
+        resized_img = resized_img.convert('RGB')
+    buffer = io.BytesIO()
+    resized_img.save(buffer, format="JPEG")
+    return ReportImage(buffer.getvalue(), resized_img.width, resized_img.height)
+
+def load_report_image(image_url: str, timeout: float = None):
+    """
+    Download a photo and prepare it for the report, all in memory.
+
+    Returns:
+    - ReportImage: The resized photo, or the FALLBACK_IMAGE path when it could not be downloaded or decoded.
+    """
     try:
-        os.makedirs(output_dir, exist_ok=True)
-        with Image.open(image_path) as img:
-            img.load()
-        os.remove(image_path)
-        resized_img = img.resize((1280, 720))
-        base_name = os.path.splitext(os.path.basename(image_path))[0]
-        if resized_img.mode != 'RGB':
-            resized_img = resized_img.convert('RGB')
-        new_image_path = os.path.join(output_dir, f"{base_name}_resized.jpg")
-        resized_img.save(new_image_path, format="JPEG")
-        return new_image_path
+        return prepare_image(fetch_image(image_url, timeout))
     except Exception as e:
-        print(f"Error processing image: {e}")
-        return ""
+        print(f"Failed to load image: {e}")
+        return FALLBACK_IMAGE
+
+def report_image(photo):
+    """Photo ready to embed: URLs are loaded here, prefetched ReportImages and file paths are used as they are."""
+    if isinstance(photo, str) and photo.startswith(("http://", "https://")):
+        return load_report_image(photo)
+    return photo
+
+class ImagePrefetch:
+    """
+    Downloads and resizes report photos on a bounded thread pool as soon as their URLs are
+    known, so the PDF layout never waits on the network.
+
+    Args:
+    - image_urls (list): Photo URLs, in the order they are wanted back.
+    - workers (int): Photos downloaded at the same time.
+    - timeout (float): Seconds allowed to connect and to read each photo.
+    """
+
+    def __init__(self, image_urls, workers=IMAGE_PREFETCH_WORKERS, timeout=IMAGE_TIMEOUT):
+        pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(image_urls))))
+        self._futures = [tracing.submit(pool, load_report_image, url, timeout) for url in image_urls]
+        # queued downloads still run, the threads exit once they are done
+        pool.shutdown(wait=False)
+
+    def results(self):
+        """
+        Returns:
+        - list: A ReportImage per URL, FALLBACK_IMAGE for photos that failed.
+        """
+        return [future.result() for future in self._futures]
+
+def image_source(photo):
+    """
+    Returns:
+    - tuple: (width, height, source) for a ReportImage or an image file path, source being what FPDF.image accepts.
+    """
+    if isinstance(photo, ReportImage):
+        return photo.width, photo.height, photo.stream()
+    from PIL import Image
+
+    with Image.open(photo) as img:
+        return img.width, img.height, photo
+
+def save_pdf(pdf, path):
+    """Write the PDF to a unique temp file and move it into place, so concurrent reports for the same address never interleave."""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        pdf.output(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def sanitize_text(text):
     if text:
@@ -52,34 +123,11 @@ def sanitize_text(text):
         return text.encode('latin-1', 'ignore').decode('latin-1')
     return ""
 
-def parse_comparables(data,avg):
-    prices = []
-    square_footages = []
-    lot_sizes = []
-    years_built = []
-    buyer_preferences = []
-
-    for entry in data:
-        # Extract sale price
-        price_match = re.search(r"Sale Price: \$(\d+(\.\d{2})?)", entry)
-        if price_match:
-            prices.append(float(price_match.group(1)))
-
-        # Extract square footage
-        sq_ft_match = re.search(r"Square Footage: (\d+(\.\d+)?) sq ft", entry)
-        if sq_ft_match:
-            sq_ft_match = sq_ft_match.group(1).replace(",","").replace(".00","")
-            square_footages.append(int(sq_ft_match))
-
-        # Extract lot size
-        lot_size_match = re.search(r"Lot Size: (\d+(\.\d+)?) sq ft", entry)
-        if lot_size_match:
-            lot_sizes.append(float(lot_size_match.group(1)))
-
-        # Extract year built
-        year_built_match = re.search(r"Year Built: (\d+)", entry)
-        if year_built_match:
-            years_built.append(int(year_built_match.group(1)))
+def parse_comparables(comps,avg):
+    prices = [comp.price for comp in comps if isinstance(comp.price, (int, float))]
+    square_footages = [round(comp.living_sqft, 2) for comp in comps if comp.living_sqft is not None]
+    lot_sizes = [round(comp.lot_sqft, 2) for comp in comps if comp.lot_sqft is not None]
+    years_built = [comp.year_built for comp in comps if isinstance(comp.year_built, int)]
 
     # Calculate averages
     avg_price = sum(prices) / len(prices) if prices else 0
@@ -114,8 +162,8 @@ class ReportPDF(FPDF):
         self.ln()
 
     def add_photo(self, photo_path, y=None, w=50):
-        img = Image.open(photo_path)
-        aspect_ratio = img.height / img.width
+        img_width, img_height, source = image_source(photo_path)
+        aspect_ratio = img_height / img_width
         h = w * aspect_ratio
         if y is None:
             y = self.get_y()
@@ -123,7 +171,7 @@ class ReportPDF(FPDF):
             self.add_page()
             y = self.t_margin
         x = (self.w - w) / 2
-        self.image(photo_path, x=x, y=y, w=w, h=h)
+        self.image(source, x=x, y=y, w=w, h=h)
         self.set_y(y + h + 5)
 
     def add_horizontal_line(self, y_position=None, line_width=0.5):
@@ -135,9 +183,8 @@ class ReportPDF(FPDF):
         self.ln(10)
 
     def add_photo_grid(self, photo_path, y=None, w=200):
-        # Open the image to get its original dimensions
-        img = Image.open(photo_path)
-        img_width, img_height = img.size  
+        # Get the image's original dimensions
+        img_width, img_height, source = image_source(photo_path)
 
         # Maintain the original aspect ratio
         aspect_ratio = img_height / img_width  
@@ -158,11 +205,72 @@ class ReportPDF(FPDF):
         x = (self.w - w) / 2
 
         # Add the image
-        self.image(photo_path, x=x, y=y, w=w, h=h)  
+        self.image(source, x=x, y=y, w=w, h=h)  
 
         # Update y position for subsequent content
         self.set_y(y + h + 5)  
 
+    def add_table(self, grid, title=None, font_size=9):
+        """
+        Draw a dict of columns (like past_market_grid) as a vector table with a bold
+        header, alternating row colours and columns sized to their content.
+
+        Args:
+        - grid (dict): Column name -> list of cell values, every column the same length.
+        - title (str): Title drawn above the table.
+        - font_size (int): Largest font size for the cells, lowered until the table fits the page width.
+        """
+        headers = [sanitize_text(str(header)) for header in grid]
+        rows = [[sanitize_text(str(value)) for value in row] for row in zip(*grid.values())]
+        page_width = self.w - self.l_margin - self.r_margin
+        widths = self._column_widths(headers, rows, font_size)
+        while sum(widths) > page_width and font_size > 6:
+            font_size -= 0.5
+            widths = self._column_widths(headers, rows, font_size)
+        # spread the remaining width over the columns so the table spans the page
+        widths = [width * page_width / sum(widths) for width in widths]
+        row_height = font_size * 0.6
+
+        if title:
+            self.set_font('Helvetica', 'B', 12)
+            self.cell(0, 8, title, align='C')
+            self.ln(8)
+        self.set_draw_color(0, 0, 0)
+        self.set_line_width(0.3)
+        self._table_header(headers, widths, row_height, font_size)
+        for i, row in enumerate(rows):
+            if self.get_y() + row_height > self.h - self.b_margin:
+                self.add_page()
+                self._table_header(headers, widths, row_height, font_size)
+            self.set_font('Helvetica', '', font_size)
+            if i % 2 == 0:
+                self.set_fill_color(240, 240, 240)
+            else:
+                self.set_fill_color(255, 255, 255)
+            self.set_x(self.l_margin)
+            for value, width in zip(row, widths):
+                self.cell(width, row_height, value, border=1, align='C', fill=True)
+            self.ln(row_height)
+        self.set_fill_color(255, 255, 255)
+        self.ln(5)
+
+    def _column_widths(self, headers, rows, font_size, padding=3):
+        self.set_font('Helvetica', 'B', font_size + 1)
+        widths = [self.get_string_width(header) + padding for header in headers]
+        self.set_font('Helvetica', '', font_size)
+        for row in rows:
+            for i, value in enumerate(row):
+                widths[i] = max(widths[i], self.get_string_width(value) + padding)
+        return widths
+
+    def _table_header(self, headers, widths, row_height, font_size):
+        self.set_font('Helvetica', 'B', font_size + 1)
+        self.set_fill_color(204, 229, 255)  # Light blue background for headers
+        self.set_x(self.l_margin)
+        for header, width in zip(headers, widths):
+            self.cell(width, row_height, header, border=1, align='C', fill=True)
+        self.ln(row_height)
+
     def add_clickable_link(self, text, url, font_size=12):
         """
         Add a clickable link to the PDF, center-aligned.
@@ -186,7 +294,7 @@ class ReportPDF(FPDF):
 
         # Reset text color
         self.set_text_color(0, 0, 0)
-    def add_property(self, image_path, text, link_text, link_url):
+    def add_property(self, image_path, details, link_text, link_url):
         # Configure styling
         self.set_font("Arial", size=12)
         line_height = self.font_size * 1.2
@@ -195,8 +303,8 @@ class ReportPDF(FPDF):
         
         # Calculate image height
         self.ln(4)
-        img = Image.open(image_path)
-        aspect_ratio = img.height / img.width
+        width, height, source = image_source(image_path)
+        aspect_ratio = height / width
         img_height = img_width * aspect_ratio
         
         # Calculate table dimensions
@@ -204,18 +312,14 @@ class ReportPDF(FPDF):
         label_width = 60   # Width for labels column
         value_width = table_width - label_width
         
-        # Split and clean text
-        details = [line.strip().lstrip('- ') for line in text.split('\n') if line.strip()]
+        # (label, value) rows, values as text
+        details = [(label, str(value).strip()) for label, value in details]
         
         # Calculate required height
         text_height = 0
-        for line in details:
-            if ':' in line:
-                label, value = line.split(':', 1)
-                value_lines = max(1, self.get_string_width(value.strip()) // value_width + 1)
-                text_height += line_height * value_lines
-            else:
-                text_height += line_height
+        for label, value in details:
+            value_lines = max(1, self.get_string_width(value) // value_width + 1)
+            text_height += line_height * value_lines
         
         total_height = img_height + text_height + (len(details)*2) + line_height + 20
         
@@ -224,7 +328,7 @@ class ReportPDF(FPDF):
             self.add_page()
         
         # Centered image
-        self.image(image_path, x=(self.w - img_width)/2, w=img_width)
+        self.image(source, x=(self.w - img_width)/2, w=img_width)
         self.ln(element_spacing)
         x_start = (self.w - table_width) / 2  # Center calculation
 
@@ -247,25 +351,18 @@ class ReportPDF(FPDF):
         self.set_font("Arial", '', 12)
         
         # Table rows with dynamic wrapping
-        for line in details:
+        for label, value in details:
             self.set_x(x_start)  # Maintain centered position
-            if ':' in line:
-                label, value = line.split(':', 1)
-                label = label.strip() + ":"
-                value = value.strip()
-                
-                # Label cell
-                self.set_font("Arial", 'B', 12)
-                self.cell(label_width, line_height, label, border='LTR')
-                
-                # Value cell with wrapping
-                self.set_font("Arial", '', 12)
-                self.multi_cell(value_width, line_height, value, border='LTR')
-            else:
-                self.multi_cell(table_width, line_height, line, border=1)
+            # Label cell
+            self.set_font("Arial", 'B', 12)
+            self.cell(label_width, line_height, label + ":", border='LTR')
+            
+            # Value cell with wrapping
+            self.set_font("Arial", '', 12)
+            self.multi_cell(value_width, line_height, value, border='LTR')
         
 
-def generate_report_seller(main_data,mainprop_url,estimated_value,comparable_data,photo_links,source_link_past,current_data,phoyo_links_current,source_link_current,tag,recommendation,additional_consideration,output_path):
+def generate_report_seller(main_data,mainprop_url,estimated_value,comparable_data,photo_links,source_link_past,current_data,phoyo_links_current,source_link_current,tag,recommendation,additional_consideration,output_path,past_market_grid,on_market_grid):
     # MAIN address
     address_main_property = main_data.split("\n")[0].split(":")[1].strip()
     pdf = ReportPDF()
@@ -277,45 +374,31 @@ def generate_report_seller(main_data,mainprop_url,estimated_value,comparable_dat
     # Property Overview
     pdf.section_title("Property Overview",align='C')
    
-    try:
-        path_pic = download_image(mainprop_url)
-        path_pic = process_image(path_pic)
-        pdf.add_photo(path_pic)  # Replace with actual image path
-        os.remove(path_pic)
-    except:
-        path_pic = "const1.jpg"
-        pdf.add_photo(path_pic)     
+    pdf.add_photo(report_image(mainprop_url))
     pdf.section_body(main_data)
     pdf.add_horizontal_line()
     # Comparable Properties (Last 6 Months)
     pdf.section_title("Comparable Properties (Last 6 Months)")
-    pdf.add_photo_grid("utils/past_sales.jpg")
+    pdf.add_table(past_market_grid, "Past Sales Data")
 
     if len(comparable_data) == 0:
         pdf.section_body("No comparable properties found in the last 6 months.")
     else:
         print(len(comparable_data),len(photo_links),len(source_link_past))
         for i in range(len(comparable_data)):
-            path_pic = download_image(photo_links[i])
-            path_pic = process_image(path_pic)
-            pdf.add_property(path_pic, comparable_data[i], "View Listing", source_link_past[i])
-            
-            os.remove(path_pic)
+            pdf.add_property(report_image(photo_links[i]), comparable_data[i].details, "View Listing", source_link_past[i])
 
     pdf.add_horizontal_line()
     # Add more properties similarly...
     pdf.section_title("Comparable Properties Currently on the Market ")
-    pdf.add_photo_grid("utils/on_market.jpg")
+    pdf.add_table(on_market_grid, "On Market Data")
 
     if len(current_data) == 0:
         pdf.section_body("No comparable properties found")
     else:
         print(len(current_data),len(phoyo_links_current),len(source_link_current))
         for i in range(len(current_data)):
-            path_pic = download_image(phoyo_links_current[i])
-            path_pic = process_image(path_pic)
-            pdf.add_property(path_pic, current_data[i], "View Listing", source_link_current[i])
-            os.remove(path_pic)
+            pdf.add_property(report_image(phoyo_links_current[i]), current_data[i].details, "View Listing", source_link_current[i])
     pdf.add_horizontal_line()
 
     pdf.section_title("Recommended Pricing Strategy",size_font=14)
@@ -334,13 +417,16 @@ def generate_report_seller(main_data,mainprop_url,estimated_value,comparable_dat
     pdf.section_title("Ready to Sell?",size_font=14)
     pdf.section_body("List your home for FREE on www.SaveOnYourHome.com and explore the tools and guidance we provide to make your selling experience as efficient and successful as possible.")
     pdf.add_photo("utils/Transparent file character -01-01.png")
-    # Output the PDF
-    pdf.output(output_path+f"seller_report{format_address(address_main_property)}.pdf")
+    # Output the PDF, kept in memory when there is no output path
+    with tracing.stage("pdf_output"):
+        if output_path is None:
+            return bytes(pdf.output())
+        save_pdf(pdf, output_path+f"seller_report{format_address(address_main_property)}.pdf")
     print(f"Report saved to {output_path}")
     return output_path+f"seller_report{sanitize_text(format_address(address_main_property))}.pdf"
 
 
-def generate_buyer_report(main_data,img_url,estimated_value,comparable_data,photo_links,source_link_past,current_data,photo_links_current,source_link_current,tag,recommendation,additional_consideration,output_path):
+def generate_buyer_report(main_data,img_url,estimated_value,comparable_data,photo_links,source_link_past,current_data,photo_links_current,source_link_current,tag,recommendation,additional_consideration,output_path,past_market_grid,on_market_grid):
     address_main_property = main_data.split("\n")[0].split(":")[1].strip()
     pdf = ReportPDF()
     pdf.add_page()
@@ -349,14 +435,7 @@ def generate_buyer_report(main_data,img_url,estimated_value,comparable_data,phot
     pdf.section_title(address_main_property,size_font=14,align='C')
     pdf.add_horizontal_line()
     pdf.section_title("Property Overview",align='C')
-    try:
-        path_pic = download_image(img_url)
-        path_pic = process_image(path_pic)
-        pdf.add_photo(path_pic)  # Replace with actual image path
-        os.remove(path_pic)
-    except:
-        path_pic = "const1.jpg"
-        pdf.add_photo(path_pic)  
+    pdf.add_photo(report_image(img_url))
     pdf.section_body(main_data)
 
     pdf.add_horizontal_line()
@@ -368,28 +447,21 @@ def generate_buyer_report(main_data,img_url,estimated_value,comparable_data,phot
     pdf.section_body(pricing_trends)
     pdf.add_horizontal_line()
     pdf.section_title("Comparable Properties (Last 6 Months)")
-    pdf.add_photo_grid("utils/past_sales.jpg")
+    pdf.add_table(past_market_grid, "Past Sales Data")
 
     if len(comparable_data) == 0:
         pdf.section_body("No comparable properties found in the last 6 months.")
     else:
         for i in range(len(comparable_data)):
-            path_pic = download_image(photo_links[i])
-            path_pic = process_image(path_pic)
-
-            pdf.add_property(path_pic, comparable_data[i], "View Listing", source_link_past[i])
-            os.remove(path_pic)
+            pdf.add_property(report_image(photo_links[i]), comparable_data[i].details, "View Listing", source_link_past[i])
     pdf.add_horizontal_line()
     pdf.section_title("Comparable Properties Currently on the Market ")
-    pdf.add_photo_grid("utils/on_market.jpg")
+    pdf.add_table(on_market_grid, "On Market Data")
     if len(current_data) == 0:
         pdf.section_body("No comparable properties found")
     else:
         for i in range(len(current_data)):
-            path_pic = download_image(photo_links_current[i])
-            path_pic = process_image(path_pic)
-            pdf.add_property(path_pic, current_data[i], "View Listing", source_link_current[i])
-            os.remove(path_pic)
+            pdf.add_property(report_image(photo_links_current[i]), current_data[i].details, "View Listing", source_link_current[i])
     pdf.add_horizontal_line()
     pdf.section_title("Suggested Offer Pricing Strategy",size_font=14)
     pdf.section_body(sanitize_text(recommendation))
@@ -406,7 +478,10 @@ def generate_buyer_report(main_data,img_url,estimated_value,comparable_data,phot
     pdf.section_title("Ready to Explore More Options?")
     pdf.section_body("""Visit www.SaveOnYourHome.com for additional tools and guidance to help you confidently navigate the home-buying process.""")
     pdf.add_photo("utils/Transparent file character -01-01.png")
-    # Output the PDF
-    pdf.output(output_path+f"buyer_report{format_address(address_main_property)}.pdf")
+    # Output the PDF, kept in memory when there is no output path
+    with tracing.stage("pdf_output"):
+        if output_path is None:
+            return bytes(pdf.output())
+        save_pdf(pdf, output_path+f"buyer_report{format_address(address_main_property)}.pdf")
     print(f"Report saved to {output_path}")
     return output_path+f"buyer_report{sanitize_text(format_address(address_main_property))}.pdf"
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+# share loads between the worker processes of the host too (needs fcntl, so not on Windows)
+SINGLEFLIGHT_PROCESSES = os.getenv("SINGLEFLIGHT_PROCESSES", "0") == "1"
+# next to the cache (CACHE_DIR), read here since utils.cache builds on this module
+SINGLEFLIGHT_LOCK_DIR = os.path.join(os.getenv("CACHE_DIR", "cache"), "locks")
+# keys are spread over this many lock files, so the lock folder doesn't grow with every key
+SINGLEFLIGHT_LOCK_STRIPES = int(os.getenv("SINGLEFLIGHT_LOCK_STRIPES", "1024"))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Group:
+    """
+    Coalesces concurrent calls with the same key into one: the first caller runs the function,
+    callers arriving while it runs wait for it and get its result (or its exception).
+
+    A leader first calls recheck() (usually a cache lookup) and only runs the function when that
+    returns None, so a caller arriving just after the previous leader stored its result and left
+    doesn't load it again. With processes=True the leader also takes a file lock for the key, so
+    leaders in other worker processes on the host wait for it, and rechecks once it holds the lock.
+
+    Args:
+    - name (str): Group name, keeps the lock files of different groups apart.
+    - processes (bool): Coalesce across processes as well as threads.
+    """
+
+    def __init__(self, name, processes=SINGLEFLIGHT_PROCESSES):
+        self.name = name
+        self.processes = processes
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, recheck=None):
+        """
+        Args:
+        - key (str): Identifies the call, e.g. normalized request parameters.
+        - fn (callable): Does the work, called without arguments.
+        - recheck (callable): Returns the result a previous leader (in any process) stored, or None.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = self._run(key, fn, recheck)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _run(self, key, fn, recheck):
+        if not self.processes:
+            return self._recheck_or_run(fn, recheck)
+        with process_lock(self.name, key):
+            return self._recheck_or_run(fn, recheck)
+
+    @staticmethod
+    def _recheck_or_run(fn, recheck):
+        if recheck is not None:
+            value = recheck()
+            if value is not None:
+                return value
+        return fn()
+
+
+@contextmanager
+def process_lock(name, key):
+    """
+    Exclusive lock for key shared by the processes of the host, a no-op where fcntl is missing.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    stripe = int(hashlib.sha256(f"{name}:{key}".encode("utf-8")).hexdigest(), 16) % SINGLEFLIGHT_LOCK_STRIPES
+    os.makedirs(SINGLEFLIGHT_LOCK_DIR, exist_ok=True)
+    with open(os.path.join(SINGLEFLIGHT_LOCK_DIR, f"{name}-{stripe}.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
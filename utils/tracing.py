@@ -0,0 +1,115 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# trace and stage of the report being generated; copied into worker threads by submit()
+_current_trace = contextvars.ContextVar("report_trace", default=None)
+_current_stage = contextvars.ContextVar("report_stage", default=None)
+
+
+class Trace:
+    """
+    Per-report record of wall time, upstream calls and bytes transferred for each stage.
+    Stages can nest and repeat; repeated stages add up.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at = None
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name):
+        # caller holds the lock
+        if name not in self.stages:
+            self.stages[name] = {"seconds": 0.0, "calls": {}, "bytes": 0}
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        token = _current_stage.set(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_stage.reset(token)
+            with self._lock:
+                self._stage(name)["seconds"] += elapsed
+
+    def record_call(self, upstream, nbytes=0, stage=None):
+        with self._lock:
+            entry = self._stage(stage or "other")
+            entry["calls"][upstream] = entry["calls"].get(upstream, 0) + 1
+            entry["bytes"] += nbytes
+
+    def add_stages(self, stages):
+        """Add stage timings recorded elsewhere (e.g. in a render process), in the form summary() returns them."""
+        with self._lock:
+            for name, other in stages.items():
+                entry = self._stage(name)
+                entry["seconds"] += other["seconds"]
+                entry["bytes"] += other["bytes"]
+                for upstream, count in other["calls"].items():
+                    entry["calls"][upstream] = entry["calls"].get(upstream, 0) + count
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def summary(self):
+        with self._lock:
+            stages = {name: {"seconds": round(entry["seconds"], 3), "calls": dict(entry["calls"]), "bytes": entry["bytes"]}
+                      for name, entry in self.stages.items()}
+        end = self.finished_at or time.time()
+        calls = {}
+        for entry in stages.values():
+            for upstream, count in entry["calls"].items():
+                calls[upstream] = calls.get(upstream, 0) + count
+        return {
+            "total_seconds": round(end - self.started_at, 3),
+            "calls": calls,
+            "bytes": sum(entry["bytes"] for entry in stages.values()),
+            "stages": stages,
+        }
+
+    def log(self, **fields):
+        """Print the summary as one structured (JSON) log line."""
+        print(json.dumps({"event": "report_trace", **fields, **self.summary()}, default=str))
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace):
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a stage of the current report; does nothing outside a report."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def record_call(upstream, nbytes=0):
+    """Count an upstream call (and its response size) against the current stage of the current report."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record_call(upstream, nbytes, _current_stage.get())
+
+
+def submit(pool, fn, *args, **kwargs):
+    """pool.submit that carries the current trace and stage into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -1,20 +1,70 @@
-import requests
 import json
-from utils.rep_gen import generate_report_seller, generate_buyer_report
+from utils import http_client, listings, metrics, rate_limit, singleflight, tracing
+from utils.cache import SQLiteCache, TieredCache, make_key
+from utils.comps import CompTable, calculate_distance_miles, convert_lot_size, read_comps, safe_convert
 import time
-from math import radians, sin, cos, sqrt, atan2
+from math import floor, ceil
 from datetime import datetime, timedelta
 import random
-import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
-from openai import OpenAI
 import re
 import os
-import cv2
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 API_KEY = os.getenv("ZILLOW_KEY")
+ZILLOW_API_URL = os.getenv("ZILLOW_API_URL", "https://zillow-working-api.p.rapidapi.com")
 API_KEY_OPENAI = os.getenv("OPENAPI_KEY")
-client = OpenAI(api_key=API_KEY_OPENAI)
+# heavy libraries (openai, numpy, fpdf, PIL) are imported inside the functions that use them,
+# so importing this module stays cheap and has no side effects
+_openai_client = None
+_openai_client_lock = threading.Lock()
+# "concurrent" requests the first bed/bath relaxation levels at once, "serial" walks them one call at a time,
+# "planned" makes one search without the bed/bath filter and relaxes it locally
+COMP_SEARCH_MODE = os.getenv("COMP_SEARCH_MODE", "concurrent")
+# sold relaxation levels the concurrent mode searches up front, later levels are searched only when reached
+COMP_PREFETCH_LEVELS = int(os.getenv("COMP_PREFETCH_LEVELS", "2"))
+# comps a level needs before the planner stops widening, and the widest radius (miles) it widens to
+COMP_TARGET = 3
+COMP_PLANNER_MAX_RADIUS = int(os.getenv("COMP_PLANNER_MAX_RADIUS", "4"))
+COMP_SEARCH_WORKERS = int(os.getenv("COMP_SEARCH_WORKERS", "8"))
+# seconds allowed for each OpenAI request of the report
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# answers are cached by model, reasoning flag and prompt so repeat reports skip OpenAI
+llm_cache = SQLiteCache(
+    "llm_responses",
+    ttl=float(os.getenv("LLM_CACHE_TTL", str(24 * 3600))),
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "2000")),
+)
+# property records are cached per type, photo links expire sooner than the rest of the record
+property_details_cache = TieredCache("property_details", ttl=float(os.getenv("PROPERTY_DETAILS_TTL", str(24 * 3600))), max_entries=int(os.getenv("PROPERTY_CACHE_SIZE", "5000")))
+property_tax_cache = TieredCache("property_tax", ttl=float(os.getenv("PROPERTY_TAX_TTL", str(7 * 24 * 3600))), max_entries=int(os.getenv("PROPERTY_CACHE_SIZE", "5000")))
+property_image_cache = TieredCache("property_images", ttl=float(os.getenv("PROPERTY_IMAGE_TTL", str(6 * 3600))), max_entries=int(os.getenv("PROPERTY_CACHE_SIZE", "5000")))
+# comps are cached per map tile so neighbouring subjects reuse one search, sold data changes slowly
+COMPS_CACHE_ENABLED = os.getenv("COMPS_CACHE_ENABLED", "1") == "1"
+COMP_TILE_SIZE = float(os.getenv("COMP_TILE_SIZE", "0.01"))  # degrees, about 0.7 miles
+# pages of a tile search fetched to get every match, tiles with more matches are not cached
+COMP_TILE_MAX_PAGES = int(os.getenv("COMP_TILE_MAX_PAGES", "3"))
+COMP_RADIUS_MILES = 1
+COMPS_SOLD_TTL = float(os.getenv("COMPS_SOLD_TTL", str(7 * 24 * 3600)))
+COMPS_FOR_SALE_TTL = float(os.getenv("COMPS_FOR_SALE_TTL", "3600"))
+comps_sold_cache = TieredCache("comps_sold", ttl=COMPS_SOLD_TTL, max_entries=int(os.getenv("COMPS_CACHE_SIZE", "2000")))
+comps_for_sale_cache = TieredCache("comps_for_sale", ttl=COMPS_FOR_SALE_TTL, max_entries=int(os.getenv("COMPS_CACHE_SIZE", "2000")))
+# every listing a comp search returns is kept, searches inside an earlier fresh one are answered locally
+LISTING_STORE_ENABLED = os.getenv("LISTING_STORE_ENABLED", "1") == "1"
+# identical uncached comp searches running at the same time share one call, its result is kept
+# briefly so callers that waited in another process (SINGLEFLIGHT_PROCESSES=1) read it instead of searching again
+comps_flight = singleflight.Group("comps")
+recent_comps_cache = SQLiteCache("recent_comps", ttl=float(os.getenv("COMPS_FLIGHT_TTL", "60")), max_entries=int(os.getenv("COMPS_CACHE_SIZE", "2000")))
+# RapidAPI calls per second shared by every worker on the host, 0 disables the limit
+rapidapi_limiter = rate_limit.TokenBucket(
+    "rapidapi",
+    rate=float(os.getenv("RAPIDAPI_RATE", "5")),
+    burst=float(os.getenv("RAPIDAPI_BURST", "10")),
+    queue_timeout=float(os.getenv("RAPIDAPI_QUEUE_TIMEOUT", "30")),
+)
+# longest wait (seconds) before retrying a RapidAPI call answered with 429/5xx, whatever its Retry-After says
+RAPIDAPI_RETRY_AFTER_MAX = float(os.getenv("RAPIDAPI_RETRY_AFTER_MAX", "10"))
+# RapidAPI calls one report may make before comp relaxation levels are skipped, 0 for no budget
+REPORT_CALL_BUDGET = int(os.getenv("REPORT_CALL_BUDGET", "8"))
 
 placeholder_url_img = "https://www.zillowstatic.com/static/images/nophoto_p_c.png"
 
@@ -29,25 +79,93 @@ def split_address(address):
     state, zip_code = state_zip.split(" ")
     return street_address, city, state, zip_code
 
-def get_property_data(address):
-
-    url = "https://zillow-working-api.p.rapidapi.com/pro/byaddress"
-
-    querystring = {"propertyaddress":address}
-
+def zillow_get(path, params):
+    """
+    GET a zillow-working-api endpoint through the shared HTTP client, after taking a token from
+    rapidapi_limiter. The call is counted against the current report's budget.
+    429 and 5xx responses are retried here rather than by the HTTP client (up to HTTP_RETRIES times),
+    so every attempt takes its own token and is counted.
+    Raises rate_limit.RateLimitExceeded when no token comes within RAPIDAPI_QUEUE_TIMEOUT.
+    """
     headers = {
         "x-rapidapi-key": API_KEY,
         "x-rapidapi-host": "zillow-working-api.p.rapidapi.com"
     }
+    attempt = 0
+    while True:
+        rapidapi_limiter.acquire()
+        rate_limit.charge_budget()
+        response = http_client.get(f"{ZILLOW_API_URL}/{path}", headers=headers, params=params, upstream="rapidapi", retry_status=False)
+        if response.status_code not in http_client.RETRY_STATUSES or attempt >= http_client.HTTP_RETRIES:
+            return response
+        attempt += 1
+        time.sleep(retry_delay(response, attempt))
+
+def retry_delay(response, attempt):
+    """
+    Seconds to wait before retrying a RapidAPI call: its Retry-After when given, else 0.5s doubling
+    per attempt, never more than RAPIDAPI_RETRY_AFTER_MAX so a header can't hold a worker for long.
+    """
+    retry_after = response.headers.get("Retry-After", "")
+    delay = int(retry_after) if retry_after.isdigit() else 0.5 * 2 ** (attempt - 1)
+    return min(delay, RAPIDAPI_RETRY_AFTER_MAX)
+
+def normalize_address(address):
+    """
+    Normalize an address so different spellings of the same property share one cache key.
+
+    Args:
+    - address (str): Address like "141-26 70th Ave, Flushing, NY 11367".
+
+    Returns:
+    - str: Upper cased address with single spaces, rebuilt from split_address when it can be parsed.
+    """
+    address = re.sub(r"\s+", " ", address.strip().upper())
+    address = re.sub(r"\s*,\s*", ", ", address)
+    try:
+        street_address, city, state, zip_code = split_address(address)
+    except (IndexError, ValueError):
+        return address
+    return f"{street_address}, {city}, {state} {zip_code}"
+
+def get_property_data(address, refresh=False):
+    """
+    Fetch the Zillow record of a property, served from property_details_cache when possible.
+    The record is also stored under its zpid and Zillow URL so later lookups by URL
+    (e.g. get_annual_tax) can reuse it.
+
+    Args:
+    - address (str): Property address.
+    - refresh (bool): Ignore the cached record and fetch a new one.
+    """
+    key = "address:" + normalize_address(address)
+    data = property_details_cache.get_or_load(key, lambda: fetch_property_data(address), refresh=refresh)
+    if data is not None:
+        zpid = (data.get('propertyDetails') or {}).get('zpid')
+        if zpid:
+            property_details_cache.set(f"zpid:{zpid}", data)
+        if data.get('zillowURL'):
+            property_details_cache.set("url:" + data['zillowURL'], data)
+    return data
+
+def fetch_property_data(address):
+    querystring = {"propertyaddress":address}
 
-    response = requests.get(url, headers=headers, params=querystring)
+    try:
+        response = zillow_get("pro/byaddress", querystring)
+    except rate_limit.RateLimitExceeded as e:
+        print("RAPIDAPI_RATE_LIMITED", e)
+        return None
 
     if not response.status_code == 200:
         return None
     return response.json()
 
 def get_property_info(address):
-    data = get_property_data(address)
+    image_key = normalize_address(address)
+    main_img_url = property_image_cache.get(image_key)
+    # a cached record whose photo link expired is fetched again to get a fresh link
+    data = get_property_data(address, refresh=main_img_url is None)
 
     if data is None:
         return {"error": "API_DATA_NOT_FOUND or API_LIMIT_REACHED"}
@@ -84,9 +202,11 @@ def get_property_info(address):
         zestimate = "N/A"
     assessed_value = (zestimate + price) / 2 if isinstance(zestimate, (int, float)) and isinstance(price, (int, float)) else "N/A"
     
-    main_img_url = property_details.get('mediumImageLink', "N/A")
-    if main_img_url == None or main_img_url == "N/A":
-        main_img_url = property_details['originalPhotos'][0]['mixedSources']['jpeg'][0]['url'] if property_details.get('originalPhotos') else placeholder_url_img
+    if main_img_url is None:
+        main_img_url = property_details.get('mediumImageLink', "N/A")
+        if main_img_url == None or main_img_url == "N/A":
+            main_img_url = property_details['originalPhotos'][0]['mixedSources']['jpeg'][0]['url'] if property_details.get('originalPhotos') else placeholder_url_img
+        property_image_cache.set(image_key, main_img_url)
     
     timeOnZillow = property_details.get('timeOnZillow', "N/A")
     daysOnZillow = int(timeOnZillow.split(" ")[0]) if isinstance(timeOnZillow, str) and timeOnZillow.split(" ")[0].isdigit() else "N/A"
@@ -94,17 +214,44 @@ def get_property_info(address):
     
     return { 'address': address,"days_on_market":daysOnZillow,'main_img_url':main_img_url, 'url': zillowURL,"zestimate":price, 'Assessed_value': taxValue, 'square_footage': livingArea, 'totalBathrooms': bathrooms, 'totalBedrooms': bedrooms, 'totalMarketValue': zestimate, 'Porperty_size': lotSize,"specifications":description,"longitude":longitude,"latitude":latitude}
 
+def check_missing_values(property_info):
+    required_keys = [
+        'address', 'days_on_market', 'main_img_url', 'url', 'zestimate',
+        'Assessed_value', 'square_footage', 'totalBathrooms', 'totalBedrooms',
+        'Porperty_size', 'specifications', 'longitude', 'latitude'
+    ]
+    
+    missing_keys = [key for key in required_keys if key not in property_info or property_info[key] in [None, "N/A", "", 0]]
+
+    if missing_keys:
+        return {"missing_keys": missing_keys, "status": "Some required values are missing"}
+    return True
+
 def get_annual_tax(data):
-    url = "https://zillow-working-api.p.rapidapi.com/taxinfo"
+    """
+    Get the last annual tax paid for a property, from property_tax_cache, then from a
+    cached property record with the same Zillow URL, and only then from the taxinfo endpoint.
+    """
+    return property_tax_cache.get_or_load("url:" + data['url'], lambda: tax_from_cached_record(data) or fetch_annual_tax(data))
 
-    querystring = {"byurl":data['url']}
+def tax_from_cached_record(data):
+    record = property_details_cache.get("url:" + data['url'])
+    if record is None:
+        return None
+    tax_history = (record.get('propertyDetails') or {}).get('taxHistory') or []
+    for entry in tax_history:
+        if entry.get('taxPaid') is not None:
+            return entry['taxPaid']
+    return None
 
-    headers = {
-        "x-rapidapi-key": API_KEY,
-        "x-rapidapi-host": "zillow-working-api.p.rapidapi.com"
-    }
+def fetch_annual_tax(data):
+    querystring = {"byurl":data['url']}
 
-    response = requests.get(url, headers=headers, params=querystring)
+    try:
+        response = zillow_get("taxinfo", querystring)
+    except rate_limit.RateLimitExceeded as e:
+        print("RAPIDAPI_RATE_LIMITED", e)
+        return None
 
     tax_resp = response.json()
     for i in range(len(tax_resp['taxHistory'])):
@@ -113,8 +260,19 @@ def get_annual_tax(data):
             break
     return annual_tax
 
-def get_comps(data,sold=False):
-    url = "https://zillow-working-api.p.rapidapi.com/search/bycoordinates"
+def get_comps(data,sold=False,radius=COMP_RADIUS_MILES,filtered=True):
+    """
+    Search comparables around the main property.
+
+    Args:
+    - data (dict): Main property data, its bedrooms and bathrooms filter sold searches.
+    - sold (bool): Search sold listings instead of listings for sale.
+    - radius (int): Search radius in miles.
+    - filtered (bool): Set to False to search sold listings without the bed/bath filter.
+
+    Returns:
+    - dict: The search response with its listings nearest first, None when the search failed.
+    """
     listing_statue = "For_Sale"
     if sold == True:
         listing_statue = 'Sold'
@@ -136,20 +294,292 @@ def get_comps(data,sold=False):
             totalBathrooms = 'FourPlus'
         else:
             totalBathrooms = 'Any'
-    if sold == True:
-        querystring = {"latitude":str(data['latitude']),"longitude":str(data['longitude']),"radius":"1","page":"1","listingStatus":listing_statue,"bed_max":str(totalBedrooms),"bathrooms":totalBathrooms,"homeType":"Houses, Townhomes, Multi-family, Condos/Co-ops, Lots-Land, Apartments, Manufactured","maxHOA":"Any","listingType":"By_Agent","listingTypeOptions":"Agent listed,New Construction,Fore-closures,Auctions","parkingSpots":"Any","mustHaveBasement":"No","daysOnZillow":"Any","soldInLast":"Any"}
+    if sold == True and filtered:
+        querystring = {"latitude":str(data['latitude']),"longitude":str(data['longitude']),"radius":str(radius),"page":"1","listingStatus":listing_statue,"bed_max":str(totalBedrooms),"bathrooms":totalBathrooms,"homeType":"Houses, Townhomes, Multi-family, Condos/Co-ops, Lots-Land, Apartments, Manufactured","maxHOA":"Any","listingType":"By_Agent","listingTypeOptions":"Agent listed,New Construction,Fore-closures,Auctions","parkingSpots":"Any","mustHaveBasement":"No","daysOnZillow":"Any","soldInLast":"Any"}
     else:
-        querystring = {"latitude":str(data['latitude']),"longitude":str(data['longitude']),"radius":"1","page":"1","listingStatus":listing_statue,"homeType":"Houses, Townhomes, Multi-family, Condos/Co-ops, Lots-Land, Apartments, Manufactured","maxHOA":"Any","listingType":"By_Agent","listingTypeOptions":"Agent listed,New Construction,Fore-closures,Auctions","parkingSpots":"Any","mustHaveBasement":"No","daysOnZillow":"Any","soldInLast":"Any"}
-    headers = {
-        "x-rapidapi-key": API_KEY,
-        "x-rapidapi-host": "zillow-working-api.p.rapidapi.com"
-    }
+        querystring = {"latitude":str(data['latitude']),"longitude":str(data['longitude']),"radius":str(radius),"page":"1","listingStatus":listing_statue,"homeType":"Houses, Townhomes, Multi-family, Condos/Co-ops, Lots-Land, Apartments, Manufactured","maxHOA":"Any","listingType":"By_Agent","listingTypeOptions":"Agent listed,New Construction,Fore-closures,Auctions","parkingSpots":"Any","mustHaveBasement":"No","daysOnZillow":"Any","soldInLast":"Any"}
+    result = None
+    if LISTING_STORE_ENABLED:
+        result = local_comps(querystring)
+        listings.listing_store_lookups.inc(status=listing_statue, result="miss" if result is None else "hit")
+    if result is None:
+        result = search_comps(data, querystring, sold, radius)
+    if result is None:
+        return None
+    # the formatters take the first comps, so every path returns them in the same order
+    return comps_within(result, float(data['latitude']), float(data['longitude']))
+
+def search_comps(data, querystring, sold, radius=COMP_RADIUS_MILES):
+    """Run a comp search upstream, through the tile cache when COMPS_CACHE_ENABLED."""
+    if not COMPS_CACHE_ENABLED:
+        return shared_fetch_comps(querystring)
+
+    latitude, longitude = float(data['latitude']), float(data['longitude'])
+    tile = comp_tile(latitude, longitude)
+    tile_latitude, tile_longitude = comp_tile_center(tile)
+    # one search from the tile center wide enough to cover the radius around any point of the tile
+    tile_query = dict(querystring, latitude=str(tile_latitude), longitude=str(tile_longitude), radius=str(comp_tile_radius(tile, radius)))
+    filters = {k: v for k, v in querystring.items() if k not in ("latitude", "longitude")}
+    cache = comps_sold_cache if sold == True else comps_for_sale_cache
+    tile_data = cache.get_or_load(make_key(tile, COMP_TILE_SIZE, filters), lambda: load_tile_comps(tile_query))
+    if tile_data is None or tile_data.get('tile_too_dense'):
+        # the tile search failed part way, or can't return every match here: search around the subject instead
+        return shared_fetch_comps(querystring)
+    nearby = comps_within(tile_data, latitude, longitude, radius)
+    # the tile held every match, so the listings within the radius are every match around the subject
+    return dict(nearby, resultsCount=dict(nearby.get('resultsCount') or {}, totalMatchingCount=len(nearby['searchResults'])))
+
+def shared_fetch_comps(querystring):
+    """fetch_comps shared by identical searches running at the same time, in this process or (with SINGLEFLIGHT_PROCESSES=1) another."""
+    key = make_key(querystring)
+
+    def fetch():
+        data = fetch_comps(querystring)
+        if data is not None:
+            recent_comps_cache.set(key, data)
+        return data
+
+    return comps_flight.do(key, fetch, recheck=lambda: recent_comps_cache.get(key))
+
+def load_tile_comps(tile_query):
+    """
+    Run a tile search, fetching its further pages when every match fits in COMP_TILE_MAX_PAGES pages.
+    A tile with more matches is cached as {'tile_too_dense': True} instead of its truncated results,
+    so the properties in it go straight to their own search.
+
+    Returns:
+    - dict: The first page's response with the listings of every page, the marker, or None when a page failed.
+    """
+    data = fetch_comps(tile_query)
+    if data is None or not search_truncated(data):
+        return data
+    total = (data.get('resultsCount') or {}).get('totalMatchingCount')
+    page_length = len(data.get('searchResults') or [])
+    if not isinstance(total, int) or not page_length or total > page_length * COMP_TILE_MAX_PAGES:
+        return {'tile_too_dense': True}
+    for page in range(2, COMP_TILE_MAX_PAGES + 1):
+        more = fetch_comps(dict(tile_query, page=str(page)))
+        if more is None:
+            return None
+        if not more.get('searchResults'):
+            break
+        data = dict(data, searchResults=data['searchResults'] + more['searchResults'])
+        if not search_truncated(data):
+            break
+    if search_truncated(data):
+        return {'tile_too_dense': True}
+    if LISTING_STORE_ENABLED:
+        # the pages together cover the tile's circle, which none of them did alone
+        try:
+            listings.listing_store.record_search(tile_query, data, comps_max_age(tile_query))
+        except Exception as e:
+            print("LISTING_STORE_ERROR", e)
+    return data
 
-    response = requests.get(url, headers=headers, params=querystring)
+def search_truncated(data):
+    """Whether a search response may be missing matches: more matches than results, or no total reported."""
+    total = (data.get('resultsCount') or {}).get('totalMatchingCount')
+    return not isinstance(total, int) or total > len(data.get('searchResults') or [])
+
+def fetch_comps(querystring):
+    try:
+        response = zillow_get("search/bycoordinates", querystring)
+    except rate_limit.RateLimitExceeded as e:
+        print("RAPIDAPI_RATE_LIMITED", e)
+        return None
     
     if not response.status_code == 200:
         return None
-    return response.json()
+    data = response.json()
+    if LISTING_STORE_ENABLED:
+        try:
+            listings.listing_store.record_search(querystring, data, comps_max_age(querystring))
+        except Exception as e:
+            print("LISTING_STORE_ERROR", e)
+    return data
+
+def comps_max_age(querystring):
+    """Seconds stored listings of the query's status stay usable, the same as the comp caches."""
+    return COMPS_SOLD_TTL if querystring.get("listingStatus") == "Sold" else COMPS_FOR_SALE_TTL
+
+def local_comps(querystring):
+    """
+    Returns:
+    - dict: The search answered from the listing store, None when it has to go upstream.
+    """
+    try:
+        return listings.local_search(querystring, comps_max_age(querystring))
+    except Exception as e:
+        print("LISTING_STORE_ERROR", e)
+        return None
+
+def comp_tile(latitude, longitude):
+    """Index of the COMP_TILE_SIZE x COMP_TILE_SIZE degree tile containing a point."""
+    return floor(latitude / COMP_TILE_SIZE), floor(longitude / COMP_TILE_SIZE)
+
+def comp_tile_center(tile):
+    return (tile[0] + 0.5) * COMP_TILE_SIZE, (tile[1] + 0.5) * COMP_TILE_SIZE
+
+def comp_tile_radius(tile, radius=COMP_RADIUS_MILES):
+    """Search radius in whole miles that covers radius miles around every point of the tile."""
+    center_latitude, center_longitude = comp_tile_center(tile)
+    corner_latitude, corner_longitude = tile[0] * COMP_TILE_SIZE, tile[1] * COMP_TILE_SIZE
+    return ceil(calculate_distance_miles(center_latitude, center_longitude, corner_latitude, corner_longitude) + radius)
+
+def comps_within(data, latitude, longitude, radius=None):
+    """
+    Order search results nearest first, keeping only those within radius miles of the subject
+    property when a radius is given (e.g. for a cached tile). Listings without a location go last.
+
+    Returns:
+    - dict: Copy of the search response with the sorted 'searchResults'.
+    """
+    table = CompTable(data.get('searchResults', []), latitude, longitude)
+    return dict(data, searchResults=table.select(table.top(len(table), table.mask(radius=radius))))
+
+def comp_search_levels(data):
+    """
+    Build the bed/bath relaxation levels walked by generate_report, most specific first.
+
+    Args:
+    - data (dict): Main property data with 'totalBedrooms' and 'totalBathrooms'.
+
+    Returns:
+    - list: One copy of data per level with bedrooms and bathrooms lowered by the level index.
+    """
+    levels = []
+    for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
+        level = dict(data)
+        level['totalBedrooms'] = data['totalBedrooms'] - i
+        level['totalBathrooms'] = data['totalBathrooms'] - i
+        levels.append(level)
+    return levels
+
+def fetch_comp_levels(data):
+    """
+    Fetch the for-sale comps and the sold comps of the first COMP_PREFETCH_LEVELS relaxation
+    levels at the same time. Most reports find enough comps in the first level or two, so
+    searching every level up front would mostly spend calls on levels that are never used.
+
+    Args:
+    - data (dict): Main property data.
+
+    Returns:
+    - tuple: (sold, for_sale) lists of get_comps results indexed by level, sold only holding the
+      prefetched levels, or (None, None) when COMP_SEARCH_MODE is "serial".
+    """
+    if COMP_SEARCH_MODE == "planned":
+        return plan_comp_levels(data)
+    if COMP_SEARCH_MODE != "concurrent":
+        return None, None
+    levels = comp_search_levels(data)
+    if not levels:
+        return [], []
+    prefetch = levels[:max(1, COMP_PREFETCH_LEVELS)]
+    remaining = rate_limit.budget_remaining()
+    if remaining is not None:
+        # keep a call for the for-sale search and one for the tax lookup
+        allowed = max(1, remaining - 2)
+        if allowed < len(prefetch):
+            rate_limit.rate_limit_rejected.inc(len(prefetch) - allowed, limiter="rapidapi", reason="budget")
+            prefetch = prefetch[:allowed]
+    with ThreadPoolExecutor(max_workers=min(COMP_SEARCH_WORKERS, len(prefetch) + 1)) as pool:
+        sold = [tracing.submit(pool, get_comps, level, True) for level in prefetch]
+        # the for-sale search has no bed/bath filter, so one call serves every level
+        for_sale = tracing.submit(pool, get_comps, data, False)
+        return [future.result() for future in sold], [for_sale.result()] * len(levels)
+
+def plan_comp_levels(data):
+    """
+    COMP_SEARCH_MODE "planned": one sold search without the bed/bath filter and one for-sale
+    search, run together. Each relaxation level is cut from the sold search locally, so a report
+    makes two comp calls instead of one per level, and a search is only repeated with a wider
+    radius when no level reaches COMP_TARGET usable comps.
+
+    Returns:
+    - tuple: (sold, for_sale) lists of search results indexed by level, like fetch_comp_levels.
+    """
+    levels = comp_search_levels(data)
+    if not levels:
+        return [], []
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        sold = tracing.submit(pool, planned_search, data, True, levels)
+        for_sale = tracing.submit(pool, planned_search, data, False, levels)
+        return sold.result(), for_sale.result()
+
+def planned_search(data, sold, levels):
+    """
+    Search from COMP_RADIUS_MILES, doubling the radius up to COMP_PLANNER_MAX_RADIUS while no level has enough comps.
+    A sold search cut short (more matches than results) is replaced by filtered searches per level.
+
+    Returns:
+    - list: The search results for each level, bed/bath filtered for sold searches.
+    """
+    radius = COMP_RADIUS_MILES
+    while True:
+        search = get_comps(data, sold, radius=radius, filtered=False)
+        if sold and search is not None and search_truncated(search):
+            # the page is full, filtering it locally would find fewer comps than the filtered searches
+            return filtered_comp_levels(levels, radius)
+        results = [relax_comps(search, level) for level in levels] if sold else [search] * len(levels)
+        if search is None or radius * 2 > COMP_PLANNER_MAX_RADIUS or any(usable_comps(result, data) >= COMP_TARGET for result in results):
+            return results
+        remaining = rate_limit.budget_remaining()
+        if remaining is not None and remaining <= 1:
+            # the last call is kept for the tax lookup
+            rate_limit.rate_limit_rejected.inc(limiter="rapidapi", reason="budget")
+            return results
+        radius *= 2
+
+def filtered_comp_levels(levels, radius):
+    """
+    Sold searches with each level's bed/bath filter, for the first COMP_PREFETCH_LEVELS levels at once
+    like the concurrent mode; generate_report searches later levels when it reaches them.
+
+    Returns:
+    - list: The search results of the prefetched levels.
+    """
+    prefetch = levels[:max(1, COMP_PREFETCH_LEVELS)]
+    with ThreadPoolExecutor(max_workers=len(prefetch)) as pool:
+        sold = [tracing.submit(pool, get_comps, level, True, radius) for level in prefetch]
+        return [future.result() for future in sold]
+
+def level_filters(level):
+    """
+    Returns:
+    - tuple: (max_beds, min_baths) get_comps sends for a relaxation level, min_baths None for any.
+    """
+    max_beds = 5 if level['totalBedrooms'] is None else level['totalBedrooms']
+    min_baths = level['totalBathrooms'] if level['totalBathrooms'] in (1, 2, 3, 4) else None
+    return max_beds, min_baths
+
+def relax_comps(search, level):
+    """Apply a relaxation level's bed/bath filter to an unfiltered search, keeping the result order."""
+    if search is None:
+        return None
+    max_beds, min_baths = level_filters(level)
+    table = CompTable(search.get('searchResults', []))
+    return dict(search, searchResults=table.select(table.mask(max_beds=max_beds, min_baths=min_baths).nonzero()[0]))
+
+def usable_comps(search, data):
+    """Comps of a search the report can show: complete enough, not the main property and with a supported photo."""
+    if search is None:
+        return 0
+    return sum(1 for comp in read_comps(search)
+               if comp.missing_score < 2.5 and comp.address not in (None, data['address'])
+               and comp.photo_link is not None and comp.photo_link.lower().endswith(SUPPORTED_PHOTO_FORMATS))
+
+def comp_level_available(levels, i):
+    """
+    Whether generate_report may use relaxation level i: it was fetched up front (concurrent and
+    planned modes), or the report's call budget allows another search. The first level is always searched.
+    """
+    if levels is not None and i < len(levels):
+        return True
+    if i == 0 or rate_limit.budget_remaining() != 0:
+        return True
+    rate_limit.rate_limit_rejected.inc(limiter="rapidapi", reason="budget")
+    return False
 
 def generate_zillow_url(address: str, zpid: str) -> str:
     """
@@ -171,35 +601,6 @@ def generate_zillow_url(address: str, zpid: str) -> str:
     
     return zillow_url
 
-def calculate_distance_miles(lat1, lon1, lat2, lon2):
-    """
-    Calculate the distance between two points (A and B) on Earth using the Haversine formula.
-
-    Args:
-    - lat1, lon1: Latitude and Longitude of point A (in decimal degrees).
-    - lat2, lon2: Latitude and Longitude of point B (in decimal degrees).
-
-    Returns:
-    - Distance in miles (float).
-    """
-    # Radius of the Earth in miles
-    R = 3958.8
-
-    # Convert latitude and longitude from degrees to radians
-    lat1_rad, lon1_rad = radians(lat1), radians(lon1)
-    lat2_rad, lon2_rad = radians(lat2), radians(lon2)
-
-    # Haversine formula
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-
-    a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-    # Distance in miles
-    distance = R * c
-    return distance
-
 def get_past_date(days_back):
     """
     Get the date 'n' days before the current date.
@@ -227,29 +628,6 @@ def convert_timestamp_to_date(timestamp_ms):
     formatted_date = date_obj.strftime('%m-%d-%Y')
     return formatted_date
 
-def safe_convert(value):
-    """
-    Convert a value to float.
-    Handles strings by removing '$' and commas, and returns None for invalid data.
-    """
-    try:
-        if isinstance(value, str):
-            value = value.replace('$', '').replace(',', '').replace(' sq ft','').strip()
-        return float(value)
-    except (ValueError, TypeError):
-        return None
-
-def convert_lot_size(value):
-    """
-    Convert lot size value to square feet.
-    If the numeric value is less than 10, assume it's in acres and convert to sqft.
-    Otherwise, assume it's already in sqft.
-    """
-    num = safe_convert(value)
-    if num is None:
-        return None
-    return num * 43560 if num < 10 else num
-
 def estimate_property_price(base_property, sold_properties, on_market_properties):
     """
     Estimates the price range for a base property based on sold and on-market comparables.
@@ -312,6 +690,8 @@ def estimate_property_price(base_property, sold_properties, on_market_properties
     sqft_prices = sold_sqft + market_sqft
     bedbath_prices = sold_bedbath + market_bedbath
     
+    import numpy as np
+
     # Use median as a robust estimator
     med_lot = np.median(lot_prices) if lot_prices else None
     med_sqft = np.median(sqft_prices) if sqft_prices else None
@@ -345,30 +725,24 @@ def estimate_property_price(base_property, sold_properties, on_market_properties
 
     return [round(min_price, 2),round(mid_price, 2), round(max_price, 2)]
 
-def get_pricing_components(data,sold=False):
+def get_pricing_components(comps,sold=False):
+    """
+    Args:
+    - comps (list): Comp records of one search, as returned by read_comps.
+    - sold (bool): Label the price sold_price rather than asking_price.
+
+    Returns:
+    - list: {price, 'beds', 'baths', 'lot_size', 'sqft'} dicts for estimate_property_price.
+    """
     info_all = []
-    properties = data['searchResults']
-    for prop in properties:
+    price_key = 'sold_price' if sold else 'asking_price'
+    for comp in comps:
+        lot_size = "N/A" if comp.lot_size is None else comp.lot_size
         try:
-            sale_amount= prop['property']['price'].get('value',"N/A")
-            bedrooms = prop['property'].get('bedrooms',"N/A")
-            bathrooms = prop['property'].get('bathrooms',"N/A")
-            square_feet = prop['property'].get('livingArea',"N/A")
-            year_built = prop['property'].get('yearBuilt',"N/A")
-            try:
-                lot_size = prop['property']['lotSizeWithUnit'].get('lotSize',"N/A")
-                lot_size = str("{:.2f}".format(float(lot_size)))
-            except:
-                lot_size = "N/A"
-            if sold == True:
-                
-                info = {'sold_price': sale_amount, 'beds': bedrooms, 'baths': bathrooms, 'lot_size': lot_size, 'sqft': square_feet}
-            else:
-                info = {'asking_price': sale_amount, 'beds': bedrooms, 'baths': bathrooms, 'lot_size': lot_size, 'sqft': square_feet}
-            info_all.append(info)
-        except Exception as e:
-            print("ERROR_DURING_FORMATING",e)
-            pass
+            lot_size = str("{:.2f}".format(float(lot_size)))
+        except (TypeError, ValueError):
+            lot_size = "N/A"
+        info_all.append({price_key: comp.price, 'beds': comp.bedrooms, 'baths': comp.bathrooms, 'lot_size': lot_size, 'sqft': comp.living_area})
     return info_all
 
 def format_currency(value):
@@ -376,71 +750,6 @@ def format_currency(value):
     return f"${value:,.2f}" if isinstance(value, float) else f"${value:,}"
 
 
-def crop_table(image_path, output_path):
-    """
-    Crops whitespace above and below the table in the given image.
-
-    Parameters:
-    - image_path: Path to the input image.
-    - output_path: Path to save the cropped image.
-    """
-    # Load the image
-    image = cv2.imread(image_path)
-
-    # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    # Apply thresholding to create a binary image
-    _, binary = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY_INV)
-
-    # Find contours
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    # Get bounding box of the largest contour (assumed to be the table)
-    x, y, w, h = cv2.boundingRect(contours[0])
-
-    # Crop the table
-    cropped = image[y:y+h, x:x+w]
-
-    # Save the cropped image
-    cv2.imwrite(output_path, cropped)
-
-    return output_path
-
-def save_table_as_image(df, title, filename):
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.axis("tight")
-    ax.axis("off")
-
-    # Create the table with alternating row colors
-    colors = [['#f0f0f0' if i % 2 == 0 else '#ffffff' for _ in range(len(df.columns))] for i in range(len(df))]
-
-    table = ax.table(cellText=df.values, colLabels=df.columns, cellLoc='center', loc='center',
-                     cellColours=colors)
-
-    table.auto_set_font_size(False)
-    table.set_fontsize(10)
-    table.auto_set_column_width([i for i in range(len(df.columns))])
-
-    # Format column headers
-    for (i, key) in enumerate(df.columns):
-        cell = table[0, i]
-        cell.set_text_props(weight='bold', fontsize=12)
-        cell.set_facecolor("#cce5ff")  # Light blue background for headers
-
-    # Set border styles
-    for key, cell in table.get_celld().items():
-        cell.set_edgecolor("black")
-        cell.set_linewidth(1.5)  # Thicker borders
-
-    # Add a title
-    plt.title(title, fontsize=14, fontweight='bold', pad=15)
-
-    # Save the table
-    plt.savefig(filename, dpi=300, bbox_inches="tight")
-    crop_table(filename, filename)
-    plt.close()
-
 def extract_prices(response, estimate_property_price, base_property, sold_market_info, on_market_info, format_currency):
     pricing = []
     try:
@@ -455,25 +764,127 @@ def extract_prices(response, estimate_property_price, base_property, sold_market
     pricing = [format_currency(price) for price in pricing]
     return pricing
 
-def openai_responce(input_text,reason =False):
+def get_openai_client():
+    """OpenAI client shared by all reports, created on first use."""
+    global _openai_client
+    if _openai_client is None:
+        with _openai_client_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=API_KEY_OPENAI)
+    return _openai_client
+
+def openai_responce(input_text,reason =False,timeout=None,use_cache=True):
+    model = "o3-mini" if reason == True else "gpt-4o-mini"
+    cache_key = make_key(model, bool(reason), input_text)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    client = get_openai_client()
+    start = time.perf_counter()
+    try:
+        response = request_openai(client, input_text, reason, timeout)
+    except Exception:
+        metrics.upstream_requests.inc(upstream="openai", status="error")
+        raise
+    finally:
+        metrics.upstream_request_duration.observe(time.perf_counter() - start, upstream="openai")
+    metrics.upstream_requests.inc(upstream="openai", status="ok")
+    content = response.choices[0].message.content
+    tracing.record_call("openai", len(content or ""))
+    if content:
+        llm_cache.set(cache_key, content)
+    return content
+
+def request_openai(client, input_text, reason, timeout):
     if reason == True:
         response = client.chat.completions.create(
                 model="o3-mini",
                 reasoning_effort="medium",
                 messages=[{"role": "developer", "content": "You are a real estate appraisal expert."},
                         {"role": "user", "content": input_text}],
+                timeout=timeout,
             )
     else:
         response = client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[{"role": "developer", "content": "You are a real estate appraisal expert."},
                         {"role": "user", "content": input_text}],
+                timeout=timeout,
             )
-    return response.choices[0].message.content
+    return response
 
-def format_property_info_comp_past(data, lat_i, lon_i,main_add):
+def run_llm_stage(prompts, timeout=LLM_TIMEOUT, use_cache=True):
+    """
+    Send all prompts of a report to OpenAI at the same time and wait for every answer.
+
+    Args:
+    - prompts (list): (input_text, reason) pairs, passed on to openai_responce.
+    - timeout (float): Seconds allowed for each request.
+    - use_cache (bool): Set to False to skip the response cache and always ask OpenAI.
 
-    formatted_properties = []
+    Returns:
+    - list: Responses in the same order as prompts, None where a request failed or timed out.
+    """
+    pool = ThreadPoolExecutor(max_workers=len(prompts))
+    futures = [tracing.submit(pool, openai_responce, input_text, reason, timeout, use_cache) for input_text, reason in prompts]
+    deadline = time.time() + timeout
+    responses = []
+    for future in futures:
+        try:
+            responses.append(future.result(timeout=max(0, deadline - time.time())))
+        except FutureTimeoutError:
+            print("OPENAI_REQUEST_TIMEOUT")
+            responses.append(None)
+        except Exception as e:
+            print("OPENAI_REQUEST_FAILED", e)
+            responses.append(None)
+    # do not hold the report back on a request that is still retrying
+    pool.shutdown(wait=False)
+    return responses
+
+SUPPORTED_PHOTO_FORMATS = (".jpg", ".jpeg", ".png", ".gif", ".bmp")
+
+def comp_display_values(comp):
+    """
+    Returns:
+    - dict: The comp's values as shown in the report, "--" where a value is missing.
+    """
+    def sq_ft(value):
+        return "--" if value is None else str("{:.2f} sq ft".format(value))
+
+    return {
+        'market_value': "--" if comp.zestimate is None else format_currency(comp.zestimate),
+        'sale_amount': "--" if comp.price is None else format_currency(comp.price),
+        'bedrooms': "--" if comp.bedrooms is None else comp.bedrooms,
+        'bathrooms': "--" if comp.bathrooms is None else comp.bathrooms,
+        'square_feet': sq_ft(comp.living_sqft),
+        'lot_size': sq_ft(comp.lot_sqft),
+        'year_built': "--" if comp.year_built is None else comp.year_built,
+        'tax': "--" if comp.tax_assessed is None else format_currency(comp.tax_assessed),
+        'distance': "--" if comp.distance is None else f"{comp.distance:.2f}",
+    }
+
+def comp_has_photo(comp):
+    print(comp.photo_link)
+    if comp.photo_link is None or not comp.photo_link.lower().endswith(SUPPORTED_PHOTO_FORMATS):
+        print("Unsupported image format")
+        return False
+    return True
+
+def format_property_info_comp_past(comps, main_add):
+    """
+    Pick up to 6 sold comps for the report and lay out their details and the past sales table.
+
+    Args:
+    - comps (list): Comp records of the sold search, as returned by read_comps.
+    - main_add (dict): Main property data, its row leads the table.
+
+    Returns:
+    - tuple: (selected Comps with their details set, prices, photo links, listing links, past_market_grid).
+    """
+    selected = []
     pricing = []
     pic_links = []
     source_links = []
@@ -486,120 +897,65 @@ def format_property_info_comp_past(data, lat_i, lon_i,main_add):
     distance_miles = ['--']
     sold_date = ['--']
 
-    if data==None:
-        return formatted_properties,pricing,pic_links
-    properties = data['searchResults']
-
-    for prop in properties:
-        try:
-            # score checking for max missing values
-            score = 0
-            # beds and bath 0.5 each
-            if prop['property'].get('bedrooms',"--") == "--":
-                score += 0.5
-            if prop['property'].get('bathrooms',"--") == "--":
-                score += 0.5
-            # square footage 2
-            if prop['property'].get('livingArea',"--") == "--":
-                score += 2
-            # lot size 1
-            if prop['property'].get('lotSizeWithUnit',"--") == "--":
-                score += 1
-            # if score is or exceeds 2.5 then skip
-            if score >= 2.5:
-                continue 
-            # Extract basic details
-            address = f"{prop['property']['address']['streetAddress']}, {prop['property']['address']['city']}, {prop['property']['address']['state']} {prop['property']['address']['zipcode']}"
-            if address == main_add['address']:
-                continue
-            photo_link = prop['property']['media']['propertyPhotoLinks']['mediumSizeLink']
-            supported_formats = (".jpg", ".jpeg", ".png", ".gif", ".bmp")
-            print(photo_link)
-            if not photo_link.lower().endswith(supported_formats):
-                print("Unsupported image format")
+    for comp in comps:
+        # skip comps missing too much (score 2.5 or more) and incomplete listings
+        if comp.missing_score >= 2.5 or comp.address is None or comp.address == main_add['address']:
+            continue
+        if not comp_has_photo(comp):
+            continue
+        if comp.status != "forSale":
+            sale_date = comp.last_sold_date
+        else:
+            sale_date = comp.days_on_zillow
+            if not isinstance(sale_date, (int, float)) or int(sale_date) > 365:
                 continue
-            market_value = prop['property']['estimates'].get('zestimate',"--")
-            if market_value != "--":
-                market_value = format_currency(market_value)
-            sale_amount= prop['property']['price'].get('value',"--")
-            if sale_amount != "--":
-                sale_amount = format_currency(sale_amount)
-            bedrooms = prop['property'].get('bedrooms',"--")
-            bathrooms = prop['property'].get('bathrooms',"--")
-            square_feet = prop['property'].get('livingArea',"--")
-            try:
-                square_feet = convert_lot_size(square_feet)
-                square_feet = str("{:.2f} sq ft".format(float(square_feet)))
-            except:
-                square_feet = "--"
-            square_footages.append(square_feet)
-            year_built = prop['property'].get('yearBuilt',"--")
-            try:
-                lot_size = prop['property']['lotSizeWithUnit'].get('lotSize',"--")
-                lot_size = convert_lot_size(lot_size)
-                lot_size = str("{:.2f} sq ft".format(float(lot_size)))
-            except:
-                lot_size = "--"
-            try:
-                tax = prop['property']['taxAssessment'].get('taxAssessedValue',"--")
-            except:
-                tax = "--"
-                print("Tax not found")
-            if tax != "--":
-                tax = format_currency(tax)
-            zpid = prop['property'].get('zpid',"--")
-            listing = prop['property']['listing'].get('listingStatus',"--")
-            if not listing == "forSale":
-                sale_date = prop['property']['lastSoldDate']
-            else:
-                sale_date = prop['property']['daysOnZillow']
-                if int(sale_date) > 365:
-                    sale_date = "Not Available"
-            source = generate_zillow_url(address,zpid)
-            try:
-                distance_from_main = f"{calculate_distance_miles(lat_i,lon_i,prop['property']['location']['latitude'],prop['property']['location']['longitude']):.2f}"
-                distance_from_main = str("{:.2f}".format(float(distance_from_main)))
-            except:
-                distance_from_main = "--"
-            sale_date_cal = convert_timestamp_to_date(sale_date)
-            sold_date.append(sale_date_cal)
-            addresses.append(address)
-            sale_prices.append(sale_amount)
-            beds.append(bedrooms)
-            baths.append(bathrooms)
-            distance_miles.append(distance_from_main)
-
-            # Format the details
-            formatted_info = f"""- Address: {address}
-                - Initial Asking Price: {market_value}
-                - Sale Price: {sale_amount}
-                - Distance from Main Property: {distance_from_main} miles
-                - Specifications: {bedrooms} bedrooms, {bathrooms} bathrooms
-                - Square Footage: {square_feet}
-                - Lot Size: {lot_size}
-                - Year Built: {year_built}
-                - Sale Date: {sale_date_cal}
-                - Assessed Value: {tax}"""
-            formatted_properties.append(formatted_info)
-            source_links.append(source)
-            pic_links.append(photo_link)
-            try:
-                pricing.append(int(sale_amount))
-            except:
-                pass
-            
-        except Exception as e:
-            print("ERROR_DURING_FORMATING",e)
-            pass
-        if len(formatted_properties) >= 6:
+        if not isinstance(sale_date, (int, float)):
+            continue
+        sale_date_cal = convert_timestamp_to_date(sale_date)
+        values = comp_display_values(comp)
+        sold_date.append(sale_date_cal)
+        addresses.append(comp.address)
+        sale_prices.append(values['sale_amount'])
+        square_footages.append(values['square_feet'])
+        beds.append(values['bedrooms'])
+        baths.append(values['bathrooms'])
+        distance_miles.append(values['distance'])
+
+        comp.details = [
+            ("Address", comp.address),
+            ("Initial Asking Price", values['market_value']),
+            ("Sale Price", values['sale_amount']),
+            ("Distance from Main Property", f"{values['distance']} miles"),
+            ("Specifications", f"{values['bedrooms']} bedrooms, {values['bathrooms']} bathrooms"),
+            ("Square Footage", values['square_feet']),
+            ("Lot Size", values['lot_size']),
+            ("Year Built", values['year_built']),
+            ("Sale Date", sale_date_cal),
+            ("Assessed Value", values['tax']),
+        ]
+        selected.append(comp)
+        source_links.append(generate_zillow_url(comp.address, "--" if comp.zpid is None else comp.zpid))
+        pic_links.append(comp.photo_link)
+        if comp.price is not None:
+            pricing.append(comp.price)
+        if len(selected) >= 6:
             break
     past_market_grid = {"Address":addresses,"Sale Price":sale_prices,"Square Footage":square_footages,"Bedrooms":beds,"Bathrooms":baths,"Distance (miles)":distance_miles,"Sold Date":sold_date}
-    # Combine all formatted properties into one string
-    return formatted_properties,pricing,pic_links,source_links,past_market_grid
+    return selected,pricing,pic_links,source_links,past_market_grid
+
+def format_property_info_comp_current(comps, main_add):
+    """
+    Pick up to 6 for-sale comps for the report and lay out their details and the on market table.
+    Comps missing too much are only used when skipping them would leave fewer than 3.
 
-def format_property_info_comp_current(data, lat_i, lon_i,main_add):
+    Args:
+    - comps (list): Comp records of the for-sale search, as returned by read_comps.
+    - main_add (dict): Main property data, its row leads the table.
 
-    formatted_properties = []
+    Returns:
+    - tuple: (selected Comps with their details set, prices, photo links, listing links, on_market_grid).
+    """
+    selected = []
     pricing = []
     pic_links = []
     source_links = []
@@ -611,133 +967,103 @@ def format_property_info_comp_current(data, lat_i, lon_i,main_add):
     baths = [main_add['totalBathrooms']]
     distance_miles = ['--']
     days_on_market = ['--']
-    if data==None:
-        return formatted_properties,pricing,pic_links,source_links
-    
-    properties = data['searchResults']
-    total_prop_onmarket = len(properties)
+
+    total_prop_onmarket = len(comps)
     skipped_props = 0
-    for prop in properties:
-        try:
-            # score checking for max missing values
-            
-            score = 0
-            # beds and bath 0.5 each
-            if prop['property'].get('bedrooms',"--") == "--":
-                score += 0.5
-            if prop['property'].get('bathrooms',"--") == "--":
-                score += 0.5
-            # square footage 2
-            if prop['property'].get('livingArea',"--") == "--":
-                score += 2
-            # lot size 1
-            if prop['property'].get('lotSizeWithUnit',"--") == "--":
-                score += 1
-            # if score is or exceeds 2.5 then skip
-            if score > 2.4:
-                # make sure at least 3 properties are returned
-                skipped_props += 1
-                if skipped_props >= total_prop_onmarket - 3:
-                    pass
-                else:
-                    continue 
-            
-            # Extract basic details
-            address = f"{prop['property']['address']['streetAddress']}, {prop['property']['address']['city']}, {prop['property']['address']['state']} {prop['property']['address']['zipcode']}"
-            if address == main_add:
+    for comp in comps:
+        if comp.missing_score > 2.4:
+            # make sure at least 3 properties are returned
+            skipped_props += 1
+            if skipped_props < total_prop_onmarket - 3:
                 continue
-            photo_link = prop['property']['media']['propertyPhotoLinks']['mediumSizeLink']
-            supported_formats = (".jpg", ".jpeg", ".png", ".gif", ".bmp")
-            print(photo_link)
-            if not photo_link.lower().endswith(supported_formats):
-                print("Unsupported image format")
+        if comp.address is None or comp.address == main_add['address']:
+            continue
+        if not comp_has_photo(comp):
+            continue
+        if comp.status != "forSale":
+            sale_date = "Already Sold"
+        else:
+            sale_date = comp.days_on_zillow
+            if not isinstance(sale_date, (int, float)):
                 continue
-            market_value = prop['property']['estimates'].get('zestimate',"--")
-            if market_value != "--":
-                market_value = format_currency(market_value)
-            sale_amount= prop['property']['price'].get('value',"--")
-            if sale_amount != "--":
-                sale_amount = format_currency(sale_amount)
-            bedrooms = prop['property'].get('bedrooms',"--")
-            bathrooms = prop['property'].get('bathrooms',"--")
-            square_feet = prop['property'].get('livingArea',"--")
-            try:
-                square_feet = convert_lot_size(square_feet)
-                square_feet = str("{:.2f} sq ft".format(float(square_feet)))
-            except:
-                square_feet = "--"
-            square_footages.append(square_feet)
-            year_built = prop['property'].get('yearBuilt',"--")
-            try:
-                lot_size = prop['property']['lotSizeWithUnit'].get('lotSize',"--")
-                lot_size = convert_lot_size(lot_size)
-                lot_size = str("{:.2f} sq ft".format(float(lot_size)))
-            except:
-                lot_size = "--"
-            try:
-                tax = prop['property']['taxAssessment'].get('taxAssessedValue',"--")
-            except:
-                tax = "--"
-                print("Tax not found")
-            if tax != "--":
-                tax = format_currency(tax)
-            zpid = prop['property'].get('zpid',"--")
-            listing = prop['property']['listing'].get('listingStatus',"--")
-            if not listing == "forSale":
-                sale_date = "Already Sold"
-            else:
-                sale_date = prop['property']['daysOnZillow']
-                if int(sale_date) > 365:
-                    sale_date = "Not Available"
-            if zpid == "--":
-                source = "--"
-            else:
-                source = generate_zillow_url(address,zpid)
-            try:
-                distance_from_main = f"{calculate_distance_miles(lat_i,lon_i,prop['property']['location']['latitude'],prop['property']['location']['longitude']):.2f}"
-                distance_from_main = str("{:.2f}".format(float(distance_from_main)))
-            except:
-                distance_from_main = "--"
-            sale_date_cal = get_past_date(sale_date)
-            if market_value == "--":
-                market_value = sale_amount
-            days_on_market.append(sale_date)
-            addresses.append(address)
-            sale_prices.append(sale_amount)
-            beds.append(bedrooms)
-            baths.append(bathrooms)
-            distance_miles.append(distance_from_main)
-            # Format the details
-            formatted_info = f"""- Address: {address}
-                - Initial List Date: {sale_date_cal}
-                - Days on Market: {sale_date}
-                - Initial List Price: {market_value}
-                - Current Price: {sale_amount}
-                - Distance from Main Property: {distance_from_main} miles
-                - Specifications: {bedrooms} bedrooms, {bathrooms} bathrooms
-                - Square Footage: {square_feet}
-                - Lot Size: {lot_size}
-                - Year Built: {year_built}
-                - Assessed Value: {tax}"""
-            formatted_properties.append(formatted_info)
-            source_links.append(source)
-            pic_links.append(photo_link)
-            try:
-                pricing.append(int(sale_amount))
-            except:
-                pass
-            
-        except Exception as e:
-            print("ERROR_DURING_FORMATING",e)
-            pass
-        if len(formatted_properties) >= 6:
+            if int(sale_date) > 365:
+                sale_date = "Not Available"
+        sale_date_cal = get_past_date(sale_date)
+        values = comp_display_values(comp)
+        market_value = values['sale_amount'] if values['market_value'] == "--" else values['market_value']
+        days_on_market.append(sale_date)
+        addresses.append(comp.address)
+        sale_prices.append(values['sale_amount'])
+        square_footages.append(values['square_feet'])
+        beds.append(values['bedrooms'])
+        baths.append(values['bathrooms'])
+        distance_miles.append(values['distance'])
+
+        comp.details = [
+            ("Address", comp.address),
+            ("Initial List Date", sale_date_cal),
+            ("Days on Market", sale_date),
+            ("Initial List Price", market_value),
+            ("Current Price", values['sale_amount']),
+            ("Distance from Main Property", f"{values['distance']} miles"),
+            ("Specifications", f"{values['bedrooms']} bedrooms, {values['bathrooms']} bathrooms"),
+            ("Square Footage", values['square_feet']),
+            ("Lot Size", values['lot_size']),
+            ("Year Built", values['year_built']),
+            ("Assessed Value", values['tax']),
+        ]
+        selected.append(comp)
+        source_links.append("--" if comp.zpid is None else generate_zillow_url(comp.address, comp.zpid))
+        pic_links.append(comp.photo_link)
+        if comp.price is not None:
+            pricing.append(comp.price)
+        if len(selected) >= 6:
             break
-    # Combine all formatted properties into one string
     on_market_grid = {"Address":addresses,"Current price":sale_prices,"Square Footage":square_footages,"Bedrooms":beds,"Bathrooms":baths,"Distance (miles)":distance_miles,"Days on Market":days_on_market}
-    return formatted_properties,pricing,pic_links,source_links,on_market_grid
+    return selected,pricing,pic_links,source_links,on_market_grid
+
+def generate_report(type_report, data, REPORT_DIR, use_cache=True, trace=None, progress=None):
+    """
+    Generate a buyer or seller report, timing each stage.
 
+    Args:
+    - type_report (str): "buyer" or "seller".
+    - data (dict): Main property data, as returned by get_property_info.
+    - REPORT_DIR (str): Directory the PDF is written to, None to get the PDF bytes back instead.
+    - use_cache (bool): Set to False to skip the OpenAI response cache.
+    - trace (tracing.Trace): Collects the stage timings, a new one is used when not given.
+    - progress (callable): Called as progress(event, **info) when comps are fetched ("comps_fetched"),
+      the OpenAI answers are in ("pricing_done"), the photos are ready ("images_ready") and the PDF is rendered ("pdf_rendered").
 
-def generate_report(type_report, data, REPORT_DIR):
+    Returns:
+    - str: Path of the generated report, or bytes: the PDF itself when REPORT_DIR is None.
+    """
+    trace = trace if trace is not None else tracing.Trace()
+    budget = rate_limit.CallBudget(REPORT_CALL_BUDGET) if REPORT_CALL_BUDGET > 0 else None
+    status = "failed"
+    metrics.reports_in_flight.inc()
+    with tracing.use_trace(trace), rate_limit.use_budget(budget):
+        try:
+            path_report = build_report(type_report, data, REPORT_DIR, use_cache, progress)
+            if isinstance(path_report, bytes):
+                status = "done"
+                metrics.report_size.observe(len(path_report), report_type=type_report)
+            elif os.path.exists(path_report):
+                status = "done"
+                metrics.report_size.observe(os.path.getsize(path_report), report_type=type_report)
+            return path_report
+        finally:
+            metrics.reports_in_flight.dec()
+            metrics.reports.inc(report_type=type_report, status=status)
+            trace.finish()
+            trace.log(report_type=type_report, address=data.get('address'))
+
+
+def build_report(type_report, data, REPORT_DIR, use_cache=True, progress=None):
+    from utils.rep_gen import ImagePrefetch
+    from utils.render_pool import render_report, report_model
+    output_dir = REPORT_DIR+"/" if REPORT_DIR is not None else None
+    progress = progress or (lambda event, **info: None)
 
     if type_report == "buyer":
 
@@ -756,44 +1082,56 @@ def generate_report(type_report, data, REPORT_DIR):
         pricing = []
         orignal_bed = data['totalBedrooms']
         orignal_bath = data['totalBathrooms']
-        for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
-            data['totalBedrooms'] = orignal_bed - i
-            data['totalBathrooms'] = orignal_bath - i
-            comparable_sales_json = get_comps(data,sold=True)
-            sold_market_info = get_pricing_components(comparable_sales_json,sold=True)
-            coparable_sale,sale_amounts,photo_link,soure_link,past_market_grid = format_property_info_comp_past(comparable_sales_json, data['latitude'], data['longitude'],data)
-
-            coparable_sales.extend(coparable_sale)
-            pricing.extend(sale_amounts)
-            soure_link_past.extend(soure_link)
-            photo_links.extend(photo_link)
-            if len(coparable_sales) >= 3:
-                data['totalBedrooms'] = orignal_bed
-                data['totalBathrooms'] = orignal_bath
-                if len(coparable_sales) >= 6:
-                    coparable_sale = coparable_sale[:6]
+        with tracing.stage("comps"):
+            sold_levels, for_sale_levels = fetch_comp_levels(data)
+            for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
+                if not comp_level_available(sold_levels, i):
+                    break
+                data['totalBedrooms'] = orignal_bed - i
+                data['totalBathrooms'] = orignal_bath - i
+                comparable_sales_json = sold_levels[i] if sold_levels is not None and i < len(sold_levels) else get_comps(data,sold=True)
+                sold_comps = read_comps(comparable_sales_json, data['latitude'], data['longitude'])
+                sold_market_info = get_pricing_components(sold_comps,sold=True)
+                coparable_sale,sale_amounts,photo_link,soure_link,past_market_grid = format_property_info_comp_past(sold_comps,data)
+
+                coparable_sales.extend(coparable_sale)
+                pricing.extend(sale_amounts)
+                soure_link_past.extend(soure_link)
+                photo_links.extend(photo_link)
+                if len(coparable_sales) >= 3:
+                    data['totalBedrooms'] = orignal_bed
+                    data['totalBathrooms'] = orignal_bath
+                    if len(coparable_sales) >= 6:
+                        coparable_sale = coparable_sale[:6]
                 
-                break
-            else:
-                data['totalBedrooms'] = orignal_bed
-                data['totalBathrooms'] = orignal_bath
-        tag = False
-        for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
-            data['totalBedrooms'] = orignal_bed - i
-            data['totalBathrooms'] = orignal_bath - i
-            current_market_data = get_comps(data,sold=False)
-            on_market_info = get_pricing_components(current_market_data,sold=False)
-            current_market_data,sale_amounts,photo_links_current,soure_link_current,on_market_grid = format_property_info_comp_current(current_market_data, data['latitude'], data['longitude'],data)
-            if len(current_market_data) >= 3:
-                data['totalBedrooms'] = orignal_bed
-                data['totalBathrooms'] = orignal_bath
-                if len(current_market_data) >= 6:
-                    current_market_data = current_market_data[:6]
-                break
-            else:
-                data['totalBedrooms'] = orignal_bed
-                data['totalBathrooms'] = orignal_bath
-        pricing.extend(sale_amounts)
+                    break
+                else:
+                    data['totalBedrooms'] = orignal_bed
+                    data['totalBathrooms'] = orignal_bath
+            tag = False
+            for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
+                if not comp_level_available(for_sale_levels, i):
+                    break
+                data['totalBedrooms'] = orignal_bed - i
+                data['totalBathrooms'] = orignal_bath - i
+                current_market_data = for_sale_levels[i] if for_sale_levels is not None and i < len(for_sale_levels) else get_comps(data,sold=False)
+                on_market_comps = read_comps(current_market_data, data['latitude'], data['longitude'])
+                on_market_info = get_pricing_components(on_market_comps,sold=False)
+                current_market_data,sale_amounts,photo_links_current,soure_link_current,on_market_grid = format_property_info_comp_current(on_market_comps,data)
+                if len(current_market_data) >= 3:
+                    data['totalBedrooms'] = orignal_bed
+                    data['totalBathrooms'] = orignal_bath
+                    if len(current_market_data) >= 6:
+                        current_market_data = current_market_data[:6]
+                    break
+                else:
+                    data['totalBedrooms'] = orignal_bed
+                    data['totalBathrooms'] = orignal_bath
+            pricing.extend(sale_amounts)
+        progress("comps_fetched", sold=len(coparable_sales), on_market=len(current_market_data))
+        # photos download in the background while the tax, table and OpenAI stages run
+        with tracing.stage("image_prefetch"):
+            images = ImagePrefetch([data['main_img_url']] + photo_links + photo_links_current)
         if int(data["days_on_market"]) > 365:
             data["days_on_market"] = "Not Available"
         #print(current_market_data)
@@ -803,10 +1141,10 @@ def generate_report(type_report, data, REPORT_DIR):
             data['Porperty_size'] = str("{:.2f} sq ft".format(float(data['Porperty_size'])))
         except:
             data['Porperty_size'] = "N/A"
-        df_past_sales = pd.DataFrame(past_market_grid)
-        df_on_market = pd.DataFrame(on_market_grid)
-        annual_propert_tax = get_annual_tax(data)
-        annual_propert_tax = format_currency(annual_propert_tax)
+        with tracing.stage("tax"):
+            annual_propert_tax = get_annual_tax(data)
+        # None when the tax lookup failed or was rate limited, the report goes on without it
+        annual_propert_tax = "N/A" if annual_propert_tax is None else format_currency(annual_propert_tax)
         main_input_data = f"""-	Address: {data['address']}
         -   Days on Market: {data["days_on_market"]} 
         -   Pricing: {data['zestimate']}
@@ -815,8 +1153,6 @@ def generate_report(type_report, data, REPORT_DIR):
         -   Current Annual Tax: {annual_propert_tax}
         -   Assessed Value: {data['Assessed_value']}
         """
-        save_table_as_image(df_past_sales, "Past Sales Data", "utils/past_sales.jpg")
-        save_table_as_image(df_on_market, "On Market Data", "utils/on_market.jpg")
         base_property = {
                 'asking_price': data['zestimate'],
                 'beds': data['totalBedrooms'],
@@ -826,15 +1162,22 @@ def generate_report(type_report, data, REPORT_DIR):
             }
         input_propert = f"Base Property:\n{base_property}\n\nPast Sales:\n" + "\n".join(str(p) for p in past_market_grid.items()) + "\n\nOn Market:\n" + "\n".join(str(o) for o in on_market_grid.items())
         input_text = f"Above is the data provided by property API based on the inserted address of the user. Along side we have other comparable listings in the area. Assess the home value based on the comparables above and also include the beds, baths etc. First find out per square feet price and then compare it to assess the estimated home value.  Analyze the following property data and return low mid and high int sale pricing for the base property only these 3 seperated by , like this (lowprice, midprice, highprice) so that i can seperate them and extract all 3 of them nothing else in responce.\n   Note please only send me the values nothing else in this format (lowprice, midprice, highprice)\n{input_propert}"
-        response = openai_responce(input_text)
+        recommendation_text = f"{input_propert}\ni am thinking of buying this property.All the values are from Zillow and this will be used to provide a basis for the price they are going to charge and ideally a few suggestions, low or high depending on the circumstances. based on this information check for the price trend for sold market property and check for supply and demand on current market and tell me in 2 lines should for this property what should be the asking price for it.\n Note that i havent set a price yet so use word recommendation instead of \"your asking price\""
+        additional_consideration_text = f"Base Property:\n{base_property}\nI am thinking of buying this property. in 2 line tell me what are the additional considerations for this property"
+        # pricing, recommendation and considerations only depend on the inputs above, so they run together
+        with tracing.stage("llm"):
+            response, recommendation, additional_consideration = run_llm_stage([(input_text, False), (recommendation_text, True), (additional_consideration_text, False)], use_cache=use_cache)
         pricing = []
         pricing =  extract_prices(response, estimate_property_price, base_property, sold_market_info, on_market_info, format_currency)
-        input_text = f"{input_propert}\ni am thinking of buying this property.All the values are from Zillow and this will be used to provide a basis for the price they are going to charge and ideally a few suggestions, low or high depending on the circumstances. based on this information check for the price trend for sold market property and check for supply and demand on current market and tell me in 2 lines should for this property what should be the asking price for it.\n Note that i havent set a price yet so use word recommendation instead of \"your asking price\""
-        recommendation = openai_responce(input_text,reason=True)
-        additional_consideration_text = f"Base Property:\n{base_property}\nI am thinking of buying this property. in 2 line tell me what are the additional considerations for this property"
-        additional_consideration = openai_responce(additional_consideration_text)
+        progress("pricing_done")
         print(pricing)
-        path_report = generate_buyer_report(main_input_data,data['main_img_url'],pricing,coparable_sales,photo_links,soure_link_past,current_market_data,photo_links_current,soure_link_current,tag,recommendation,additional_consideration,REPORT_DIR+"/")
+        with tracing.stage("image_wait"):
+            main_image, *comp_images = images.results()
+        progress("images_ready")
+        photo_links, photo_links_current = comp_images[:len(photo_links)], comp_images[len(photo_links):]
+        with tracing.stage("render"):
+            path_report = render_report(report_model("buyer",main_input_data,main_image,pricing,coparable_sales,photo_links,soure_link_past,current_market_data,photo_links_current,soure_link_current,tag,recommendation,additional_consideration,output_dir,past_market_grid,on_market_grid))
+        progress("pdf_rendered")
         return path_report
     
     elif type_report == "seller":
@@ -845,44 +1188,56 @@ def generate_report(type_report, data, REPORT_DIR):
         pricing = []
         orignal_bed = data['totalBedrooms']
         orignal_bath = data['totalBathrooms']
-        for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
-            data['totalBedrooms'] = orignal_bed - i
-            data['totalBathrooms'] = orignal_bath - i
-            comparable_sales_json = get_comps(data,sold=True)
-            sold_market_info = get_pricing_components(comparable_sales_json,sold=True)
-            coparable_sale,sale_amounts,photo_links,soure_link_past,past_market_grid = format_property_info_comp_past(comparable_sales_json, data['latitude'], data['longitude'],data)
-            if len(coparable_sale) >= 3:
-                data['totalBedrooms'] = orignal_bed
-                data['totalBathrooms'] = orignal_bath
-                if len(coparable_sale) >= 6:
-                    coparable_sale = coparable_sale[:6]
-                break
-            else:
-                data['totalBedrooms'] = orignal_bed
-                data['totalBathrooms'] = orignal_bath
+        with tracing.stage("comps"):
+            sold_levels, for_sale_levels = fetch_comp_levels(data)
+            for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
+                if not comp_level_available(sold_levels, i):
+                    break
+                data['totalBedrooms'] = orignal_bed - i
+                data['totalBathrooms'] = orignal_bath - i
+                comparable_sales_json = sold_levels[i] if sold_levels is not None and i < len(sold_levels) else get_comps(data,sold=True)
+                sold_comps = read_comps(comparable_sales_json, data['latitude'], data['longitude'])
+                sold_market_info = get_pricing_components(sold_comps,sold=True)
+                coparable_sale,sale_amounts,photo_links,soure_link_past,past_market_grid = format_property_info_comp_past(sold_comps,data)
+                if len(coparable_sale) >= 3:
+                    data['totalBedrooms'] = orignal_bed
+                    data['totalBathrooms'] = orignal_bath
+                    if len(coparable_sale) >= 6:
+                        coparable_sale = coparable_sale[:6]
+                    break
+                else:
+                    data['totalBedrooms'] = orignal_bed
+                    data['totalBathrooms'] = orignal_bath
         
-        coparable_sales.extend(coparable_sale)
-        pricing.extend(sale_amounts)
-        if len(coparable_sales) >= 6:
-            coparable_sale = coparable_sale[:6]
+            coparable_sales.extend(coparable_sale)
+            pricing.extend(sale_amounts)
+            if len(coparable_sales) >= 6:
+                coparable_sale = coparable_sale[:6]
                 
-        tag = False
-        for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
-            data['totalBedrooms'] = orignal_bed - i
-            data['totalBathrooms'] = orignal_bath - i
-            current_market_data = get_comps(data,sold=False)
-            on_market_info = get_pricing_components(current_market_data,sold=False)
-            current_market_data,sale_amounts,photo_links_current,soure_link_current,on_market_grid = format_property_info_comp_current(current_market_data, data['latitude'], data['longitude'],data)
-            if len(current_market_data) >= 3:
-                data['totalBedrooms'] = orignal_bed
-                data['totalBathrooms'] = orignal_bath
-                if len(current_market_data) >= 6:
-                    current_market_data = current_market_data[:6]
-                break
-            else:
-                data['totalBedrooms'] = orignal_bed
-                data['totalBathrooms'] = orignal_bath
-        pricing.extend(sale_amounts)
+            tag = False
+            for i in range(min(data['totalBathrooms'],data['totalBedrooms'])):
+                if not comp_level_available(for_sale_levels, i):
+                    break
+                data['totalBedrooms'] = orignal_bed - i
+                data['totalBathrooms'] = orignal_bath - i
+                current_market_data = for_sale_levels[i] if for_sale_levels is not None and i < len(for_sale_levels) else get_comps(data,sold=False)
+                on_market_comps = read_comps(current_market_data, data['latitude'], data['longitude'])
+                on_market_info = get_pricing_components(on_market_comps,sold=False)
+                current_market_data,sale_amounts,photo_links_current,soure_link_current,on_market_grid = format_property_info_comp_current(on_market_comps,data)
+                if len(current_market_data) >= 3:
+                    data['totalBedrooms'] = orignal_bed
+                    data['totalBathrooms'] = orignal_bath
+                    if len(current_market_data) >= 6:
+                        current_market_data = current_market_data[:6]
+                    break
+                else:
+                    data['totalBedrooms'] = orignal_bed
+                    data['totalBathrooms'] = orignal_bath
+            pricing.extend(sale_amounts)
+        progress("comps_fetched", sold=len(coparable_sales), on_market=len(current_market_data))
+        # photos download in the background while the tax, table and OpenAI stages run
+        with tracing.stage("image_prefetch"):
+            images = ImagePrefetch([data['main_img_url']] + photo_links + photo_links_current)
         data['zestimate'] = format_currency(data['zestimate'])
         #data['totalMarketValue'] = format_currency(data['totalMarketValue'])
         pricing = []
@@ -893,23 +1248,21 @@ def generate_report(type_report, data, REPORT_DIR):
                 'lot_size': data['Porperty_size'],
                 'sqft': data['square_footage']
             }
-        df_past_sales = pd.DataFrame(past_market_grid)
-        df_on_market = pd.DataFrame(on_market_grid)
-        save_table_as_image(df_past_sales, "Past Sales Data", "utils/past_sales.jpg")
-        save_table_as_image(df_on_market, "On Market Data", "utils/on_market.jpg")
         input_propert = f"Base Property:\n{base_property}\n\nPast Sales:\n" + "\n".join(str(p) for p in past_market_grid.values()) + "\n\nOn Market:\n" + "\n".join(str(o) for o in on_market_grid.values())
         input_text = f"Suppose you are a appraisal expert. Above is the data provided by property API based on the inserted address of the user. Along side we have other comparable listings in the area. Assess the home value based on the comparables above and also include the beds, baths etc. First find out per square feet price and then compare it to assess the estimated home value.  Analyze the following property data and return low mid and high int sale pricing for the base property only these 3 seperated by , like this (lowprice, midprice, highprice) so that i can seperate them and extract all 3 of them nothing else in responce.\n   Note please only send me the values nothing else in this format (lowprice, midprice, highprice)\n{input_propert}"
-        # OpenAI API request
-        response = openai_responce(input_text)
+        recommendation_text = f"{input_propert}\nI am selling this property,all the values are from Zillow and nothing has been setup yet , the purpose of this is to provide a basis for the price i am going to charge and ideally a few suggestions, low or high depending on the circumstances. based on past trends and current market what you should recommend about pricing based on supply and demand and based on pricing trends in 2 3 lines"
+        additional_consideration_text = f"Base Property:\n{base_property}\nI am thinking of selling this property. in 2 line tell me what are the additional considerations for this property"
+        # OpenAI API requests, sent together since none of them needs another's answer
+        with tracing.stage("llm"):
+            response, recommendation, additional_consideration = run_llm_stage([(input_text, False), (recommendation_text, True), (additional_consideration_text, False)], use_cache=use_cache)
         pricing = []
         pricing = extract_prices(response, estimate_property_price, base_property, sold_market_info, on_market_info, format_currency)
-        input_text = f"{input_propert}\nI am selling this property,all the values are from Zillow and nothing has been setup yet , the purpose of this is to provide a basis for the price i am going to charge and ideally a few suggestions, low or high depending on the circumstances. based on past trends and current market what you should recommend about pricing based on supply and demand and based on pricing trends in 2 3 lines"
-        recommendation = openai_responce(input_text,True)
-        additional_consideration_text = f"Base Property:\n{base_property}\nI am thinking of selling this property. in 2 line tell me what are the additional considerations for this property"
-        additional_consideration = openai_responce(additional_consideration_text)
+        progress("pricing_done")
         data['Assessed_value'] = format_currency(data['Assessed_value'])
-        annual_propert_tax = get_annual_tax(data)
-        annual_propert_tax = format_currency(annual_propert_tax)
+        with tracing.stage("tax"):
+            annual_propert_tax = get_annual_tax(data)
+        # None when the tax lookup failed or was rate limited, the report goes on without it
+        annual_propert_tax = "N/A" if annual_propert_tax is None else format_currency(annual_propert_tax)
         main_input_data = f"""-	Address: {data['address']}
         -   Specifications: {data['totalBedrooms']} bedrooms, {data['totalBathrooms']} bathrooms, approximately {data['square_footage']} sq ft
         -   Lot Size: {data['Porperty_size']} sq ft
@@ -918,7 +1271,13 @@ def generate_report(type_report, data, REPORT_DIR):
         -   Estimated Property Pricing: {pricing[0]} - {pricing[1]}    (based on comparables)
         """
 
-        path_report = generate_report_seller(main_input_data,data['main_img_url'],pricing,coparable_sales,photo_links,soure_link_past,current_market_data,photo_links_current,soure_link_current,tag,recommendation,additional_consideration,REPORT_DIR+"/")
+        with tracing.stage("image_wait"):
+            main_image, *comp_images = images.results()
+        progress("images_ready")
+        photo_links, photo_links_current = comp_images[:len(photo_links)], comp_images[len(photo_links):]
+        with tracing.stage("render"):
+            path_report = render_report(report_model("seller",main_input_data,main_image,pricing,coparable_sales,photo_links,soure_link_past,current_market_data,photo_links_current,soure_link_current,tag,recommendation,additional_consideration,output_dir,past_market_grid,on_market_grid))
+        progress("pdf_rendered")
         return path_report
     
     else: